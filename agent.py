@@ -1,7 +1,8 @@
 from langgraph.prebuilt import create_react_agent
 from langgraph.checkpoint.memory import MemorySaver
 from typing import Any, Iterator
-from tools import search, get_commentaries, read_text
+from tools import (search, multi_search, count_matches, get_commentaries, read_commentaries, read_text, read_context,
+                   tantivy, search_metrics, facets_supported)
 from llm_providers import LLMProvider
 
 SYSTEM_PROMPT = """
@@ -9,11 +10,11 @@ SYSTEM_PROMPT = """
 
     עליך לענות תשובות אך ורק על פי מקורות שמצאת בחיפוש ועיון מעמיק, ולא על פי ידע קודם.
 
-    כאשר אתה מקבל שאלה מהמשתמש, עליך לנסות להבין את כוונתו, את ההקשר ההיסטורי וההלכתי, ואת המקורות הרלוונטיים. עליך ליצור שאילתת חיפוש מתאימה באמצעות הכלי search, תוך שימוש בשפה תורנית מדויקת. עבור תנ"ך השתמש בשפה מקראית, לחיפוש בתלמוד חפש בארמית, וכן הלאה. תוכל לצמצם את החיפוש לפי נושאים, תקופות, מחברים, ואף לפי שם הספר או הקטע הדרוש.
+    כאשר אתה מקבל שאלה מהמשתמש, עליך לנסות להבין את כוונתו, את ההקשר ההיסטורי וההלכתי, ואת המקורות הרלוונטיים. עליך ליצור שאילתת חיפוש מתאימה באמצעות הכלי search, תוך שימוש בשפה תורנית מדויקת. עבור תנ"ך השתמש בשפה מקראית, לחיפוש בתלמוד חפש בארמית, וכן הלאה. כדי לנסות כמה ניסוחים בבת אחת (מקראי, משנאי, ארמי) השתמש בכלי multi_search. תוכל לצמצם את החיפוש לפי נושאים, תקופות, מחברים, ואף לפי שם הספר או הקטע הדרוש.{count_matches_prompt}
 
     אם לא מצאת תוצאות רלוונטיות, אל תתייאש. נסה שוב ושוב, תוך שימוש בשאילתות מגוונות, מילים נרדפות, הטיות שונות של מילות המפתח, וצמצום או הרחבת היקף החיפוש. זכור, תלמיד חכם אמיתי אינו מוותר עד שהוא מוצא את האמת.
 
-    כאשר אתה מוצא מקורות רלוונטיים, עליך לקרוא אותם בעיון ובקפידה באמצעות הכלי get_text. אם יש צורך, תוכל להיעזר בכלי get_commentaries כדי לקבל רשימה של פרשנים על טקסט מסוים.
+    כאשר אתה מוצא מקורות רלוונטיים, עליך לקרוא אותם בעיון ובקפידה באמצעות הכלי get_text. כדי לקרוא את ההקשר שלפני ואחרי תוצאת חיפוש, השתמש בכלי read_context עם ההפניה של התוצאה. אם יש צורך, תוכל להיעזר בכלי get_commentaries כדי לקבל רשימה של פרשנים על טקסט מסוים, או בכלי read_commentaries כדי לקרוא בבת אחת את הפסוק ואת דברי הפרשנים עליו.
 
     עליך לשאוף למצוא את המקורות הקדומים והמוסמכים ביותר לכל פרט בשאלה. לדוגמה, אם מצאת הלכה מסוימת בספר שיצא לאחרונה, נסה למצוא את מקורה בשולחן ערוך, ואז בגמרא, ואף במשנה או במקרא. השתמש בספר "באר הגולה" על שולחן ערוך כדי למצוא את המקורות בגמרא.
 
@@ -21,18 +22,27 @@ SYSTEM_PROMPT = """
 
     זכור, אתה משול לתלמיד חכם, ועל כן עליך להפגין בקיאות, חריפות, עמקות ודייקנות בכל תשובותיך.
     """
+# Offered only on indexes that can count matches per topic and book
+COUNT_MATCHES_PROMPT = " הכלי count_matches מראה כמה תוצאות יש לשאילתה בכל נושא ובכל ספר, כדי לבחור סינון מתאים."
 
 class Agent:
     def __init__(self,index_path: str):
         self.llm_provider = LLMProvider() 
         self.llm = self.llm_provider.get_provider(self.llm_provider.get_available_providers()[0])
         self.memory_saver = MemorySaver()
-        self.tools = [read_text, get_commentaries, search]
+        # The index the tools search, and its metrics registry (None unless enabled)
+        self.search_index = tantivy
+        self.search_metrics = search_metrics
+        self.tools = [read_text, read_context, get_commentaries, read_commentaries, search, multi_search]
+        if facets_supported:
+            self.tools.append(count_matches)
+        self.system_prompt = SYSTEM_PROMPT.format(
+            count_matches_prompt=COUNT_MATCHES_PROMPT if facets_supported else "")
         self.graph = create_react_agent(
             model=self.llm,
             checkpointer=self.memory_saver,
             tools=self.tools,
-            state_modifier=SYSTEM_PROMPT
+            state_modifier=self.system_prompt
         )
         self.current_thread_id = 1
         
@@ -42,7 +52,7 @@ class Agent:
             model=self.llm,
             checkpointer=self.memory_saver,
             tools=self.tools,
-            state_modifier=SYSTEM_PROMPT
+            state_modifier=self.system_prompt
         )
         
     def get_llm(self) -> str:
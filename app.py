@@ -2,12 +2,13 @@ import streamlit as st
 import os
 from typing import Optional, List
 from dotenv import load_dotenv
-import gdown
 import llm_providers
 import tantivy_search
 import agent
 import json
-import zipfile
+import threading
+import time
+import index_download
 
 
 INDEX_PATH = "./index"
@@ -18,6 +19,13 @@ load_dotenv()
 class SearchAgentUI:
     index_path = INDEX_PATH
     gdrive_index_id = os.getenv("GDRIVE_INDEX_ID", "1lpbBCPimwcNfC0VZOlQueA4SHNGIp5_t")
+    # A manifest of individual index files takes precedence over the zipped index
+    index_manifest_url = os.getenv("INDEX_MANIFEST_URL")
+    index_url = os.getenv(
+        "INDEX_URL",
+        f"https://drive.usercontent.google.com/download?id={gdrive_index_id}&export=download&confirm=t"
+    )
+    index_sha256 = os.getenv("INDEX_SHA256")
 
    
     @st.cache_resource
@@ -25,31 +33,32 @@ class SearchAgentUI:
         index_path = INDEX_PATH
         return agent.Agent(index_path)    
 
-    def download_index_from_gdrive(self) -> bool:
-        try:
-            zip_path = "index.zip"
-            url = f"https://drive.google.com/uc?id={self.gdrive_index_id}"
-            gdown.download(url, zip_path, quiet=False)  
-            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                zip_ref.extractall(".")
-            os.remove(zip_path) 
-            return True
-        
-        except Exception as e:
-            st.error(f"Failed to download index: {str(e)}")
-            return False
-        
-        
+    def download_index(self):
+        if self.index_manifest_url:
+            index_download.download_index(self.index_manifest_url, self.index_path)
+        else:
+            index_download.download_index_archive(self.index_url, self.index_path, self.index_sha256)
+
+    @st.cache_resource
+    def start_index_download(_self) -> dict:
+        """Download the index in a background thread, once per process, so the page keeps rendering"""
+        status = {"done": False, "error": None}
+
+        def run():
+            try:
+                _self.download_index()
+            except Exception as e:
+                status["error"] = str(e)
+            finally:
+                status["done"] = True
+
+        threading.Thread(target=run, daemon=True).start()
+        return status
+
     @st.cache_resource
     def initialize_system(_self,api_keys:dict[str,str]) -> tuple[bool, str, List[str]]:
         
         try:
-            # download index
-            if not os.path.exists(_self.index_path):
-                st.warning("Index folder not found. Attempting to download from Google Drive...")
-                if not _self.download_index_from_gdrive():
-                    return False, "שגיאה: לא ניתן להוריד את האינדקס", []
-                st.success("Index downloaded successfully!")
             _self.llm_providers = llm_providers.LLMProvider(api_keys)   
             available_providers = _self.llm_providers.get_available_providers()
             if not available_providers:
@@ -245,6 +254,20 @@ class SearchAgentUI:
 
             st.markdown("---")
 
+        # Download the index in the background if it is missing
+        if not os.path.exists(self.index_path):
+            download = self.start_index_download()
+            if download["error"]:
+                st.error(f"שגיאה: לא ניתן להוריד את האינדקס: {download['error']}")
+                if st.button("נסה שוב"):
+                    self.start_index_download.clear()
+                    st.rerun()
+                return
+            if not download["done"]:
+                st.info("מוריד את האינדקס, החיפוש יהיה זמין בסיום ההורדה...")
+                time.sleep(2)
+                st.rerun()
+
         # Initialize system
         success, status_msg, available_providers = self.initialize_system(st.session_state.api_keys)
 
@@ -269,6 +292,15 @@ class SearchAgentUI:
                 if agent:
                     agent.set_llm(provider)
 
+                if agent:
+                    if agent.search_index.is_ready():
+                        st.caption(f"האינדקס מוכן ({agent.search_index.warmup_seconds or 0:.1f} שניות טעינה)")
+                    else:
+                        st.caption("האינדקס בטעינה, החיפושים הראשונים עשויים להיות איטיים")
+                    if agent.search_metrics is not None:
+                        with st.expander("מדדי חיפוש"):
+                            st.code(agent.search_metrics.to_prometheus(), language="text")
+
 
 
         # Main chat interface
@@ -290,6 +322,13 @@ class SearchAgentUI:
                                             for result in results:
                                                 st.write(result['reference'])
                                                 st.info(result['text'])
+                                    elif message.name == "multi_search":
+                                        searches = json.loads(message.content) if message.content else []
+                                        for search in searches:
+                                            with st.expander(f"🔍 {search['query']}: {len(search['results'])}"):
+                                                for result in search['results']:
+                                                    st.write(result['reference'])
+                                                    st.info(result['text'])
                                     elif message.name == "get_text":
                                         st.expander(f"📝 טקסט: {message.content}")
                                     
@@ -0,0 +1,76 @@
+"""Benchmark of the Hebrew-normalized index.
+
+Builds the same synthetic corpus (pointed text, prefixed words, final
+letters) twice, with the plain schema and with the normalized text field,
+and reports indexing throughput and the number of zero-hit queries from a
+fixed query set written the way the agent writes them (unpointed, without
+prefixes).
+
+    python benchmarks/hebrew_analyzer_bench.py [num_docs]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tantivy import Document, Index, SchemaBuilder
+from hebrew import add_hebrew_fields, normalize_hebrew, register_hebrew_analyzer, NORMALIZED_TEXT_FIELD
+from tantivy_search import TantivySearch
+
+POINTED_WORDS = [
+    "בְּרֵאשִׁית", "בָּרָא", "אֱלֹהִים", "הַשָּׁמַיִם", "וְהָאָרֶץ", "הַשַּׁבָּת", "לַחוֹלֶה", "אָסוּר",
+    "מֶלֶךְ", "וּבַמֶּלֶךְ", "שָׁלוֹם", "לְשָׁלוֹם", "מִצְוָה", "בְּמִצְוֹת", "הַכֹּהֵן", "כֹּהֲנִים",
+    "יִשְׂרָאֵל", "בְּיִשְׂרָאֵל", "תּוֹרָה", "וּבַתּוֹרָה", "אֶרֶץ", "מִצְרַיִם", "וּמִמִּצְרַיִם",
+]
+PLAIN_WORDS = "אמר רבי יוחנן תנו רבנן מאי טעמא והתניא שבת חולה מלאכה פיקוח נפש".split()
+QUERIES = [
+    "בראשית", "ברא", "אלהים", "שמים", "ארץ", "שבת", "חולה", "אסור", "מלך", "שלום", "מצוה",
+    "מצות", "כהן", "כהנים", "ישראל", "תורה", "מצרים", "+שבת +חולה", '"ברא אלהים"', "text:מלך",
+]
+
+
+def build(path, num_docs, hebrew):
+    builder = SchemaBuilder()
+    for name in ("text", "reference", "topics", "title"):
+        builder.add_text_field(name, stored=True)
+    builder.add_text_field("filePath", stored=True, tokenizer_name="raw")
+    builder.add_integer_field("segment", stored=True, indexed=True, fast=True)
+    builder.add_boolean_field("isPdf", stored=True)
+    if hebrew:
+        add_hebrew_fields(builder)
+    index = Index(builder.build(), path)
+    if hebrew:
+        register_hebrew_analyzer(index)
+    random.seed(0)
+    writer = index.writer()
+    start = time.perf_counter()
+    for i in range(num_docs):
+        text = " ".join(random.choices(POINTED_WORDS, k=30) + random.choices(PLAIN_WORDS, k=30))
+        fields = dict(text=text, reference=f"ספר {i}", topics="תנך", title="ספר",
+                      filePath="/corpus/book.txt", segment=i, isPdf=False)
+        if hebrew:
+            fields[NORMALIZED_TEXT_FIELD] = normalize_hebrew(text)
+        writer.add_document(Document(**fields))
+    writer.commit()
+    writer.wait_merging_threads()
+    return num_docs / (time.perf_counter() - start)
+
+
+def main():
+    num_docs = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    for hebrew in (False, True):
+        with tempfile.TemporaryDirectory() as path:
+            docs_per_sec = build(path, num_docs, hebrew)
+            search = TantivySearch(path, cache_size=0)
+            zero_hits = [query for query in QUERIES
+                         if not search.search(query, 1, fields=["score"], highlights=False)]
+            label = "normalized" if hebrew else "plain"
+            print(f"{label:10}: {docs_per_sec:8.0f} docs/s, "
+                  f"{len(zero_hits)}/{len(QUERIES)} zero-hit queries {zero_hits}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Micro-benchmark of per-hit highlighting cost.
+
+Compares the previous inline highlighter of TantivySearch.search (pattern
+rebuilt for every hit, one window per match) with the precompiled
+Highlighter, on a synthetic set of long Hebrew segments.
+
+    python benchmarks/highlight_bench.py [num_hits] [words_per_hit]
+"""
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from highlighter import Highlighter
+
+WORDS = ("אמר רבי יוחנן שבת חולה אסור מותר בשבת ושבת הַשַּׁבָּת מלאכה רפואה "
+         "פיקוח נפש דוחה את השבת תנו רבנן והתניא מאי טעמא").split()
+QUERY = '+שבת +חולה +(אסור OR מותר) -הבלים'
+
+
+def legacy_highlight(text, query):
+    highlight_terms = re.sub(
+        r'[:"()[\]{}^~*\\]|\b(AND|OR|NOT|TO|IN)\b|[-+]',
+        ' ',
+        query
+    ).strip()
+    highlight_terms = [term for term in highlight_terms.split() if len(term) > 1]
+    if highlight_terms:
+        patterns = [re.escape(term) for term in highlight_terms]
+        pattern = '|'.join(patterns)
+        matches = list(re.finditer(pattern, text, re.IGNORECASE))
+        if matches:
+            highlights = []
+            for match in matches:
+                start = max(0, match.start() - 50)
+                end = min(len(text), match.end() + 50)
+                highlight = text[start:end]
+                if start > 0:
+                    highlight = f"...{highlight}"
+                if end < len(text):
+                    highlight = f"{highlight}..."
+                highlights.append(highlight)
+            return highlights
+    return [text[:100] + "..." if len(text) > 100 else text]
+
+
+def main():
+    num_hits = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    words_per_hit = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    random.seed(0)
+    texts = [" ".join(random.choices(WORDS, k=words_per_hit)) for _ in range(num_hits)]
+
+    start = time.perf_counter()
+    legacy = [legacy_highlight(text, QUERY) for text in texts]
+    legacy_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    highlighter = Highlighter(QUERY)
+    compiled = [highlighter.highlight(text) for text in texts]
+    compiled_time = time.perf_counter() - start
+
+    def chars(results):
+        return sum(len(fragment) for fragments in results for fragment in fragments) / len(results)
+
+    print(f"{num_hits} hits x {words_per_hit} words")
+    print(f"legacy:   {legacy_time / num_hits * 1e6:8.1f} us/hit, {chars(legacy):8.0f} chars/hit")
+    print(f"compiled: {compiled_time / num_hits * 1e6:8.1f} us/hit, {chars(compiled):8.0f} chars/hit")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Benchmark of the pooled Sefaria session.
+
+Starts a local stand-in for the Sefaria API (a threaded HTTP/1.1 server
+answering every text request with the same small JSON document) and
+measures requests/sec of one requests.get() per call against the shared
+keep-alive session of sefaria.py, sequentially and from several threads
+the way concurrent agent sessions call it.
+
+    python benchmarks/sefaria_session_bench.py [num_requests] [threads]
+"""
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+import sefaria
+
+BODY = json.dumps({"versions": [{"text": "בראשית ברא אלהים את השמים ואת הארץ"}]}).encode()
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately; without this, delayed ACKs stall keep-alive requests
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(BODY)))
+        self.end_headers()
+        self.wfile.write(BODY)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def bare_get(url):
+    response = requests.get(url, timeout=sefaria.TIMEOUT)
+    response.raise_for_status()
+    return response.json()
+
+
+def pooled_get(url):
+    return sefaria._get_request_json_data("api/v3/texts/", url.rsplit("/", 1)[1])
+
+
+def run(get, base_url, num_requests, threads):
+    urls = [f"{base_url}/api/v3/texts/Genesis.1.{i % 31 + 1}" for i in range(num_requests)]
+    start = time.perf_counter()
+    if threads == 1:
+        for url in urls:
+            get(url)
+    else:
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            list(executor.map(get, urls))
+    return num_requests / (time.perf_counter() - start)
+
+
+def main():
+    num_requests = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    sefaria.SEFARIA_API_BASE_URL = base_url
+
+    print(f"{num_requests} requests to a local stand-in server")
+    for label, get in (("requests.get per call", bare_get), ("pooled session", pooled_get)):
+        sequential = run(get, base_url, num_requests, 1)
+        concurrent = run(get, base_url, num_requests, threads)
+        print(f"{label:22} sequential {sequential:8.0f} req/s   {threads} threads {concurrent:8.0f} req/s")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+from typing import Callable, List, Optional
+import re
+from tantivy import Filter, TextAnalyzerBuilder, Tokenizer
+
+
+# Hebrew points and cantillation marks, without the punctuation in that block
+# (maqaf, paseq, sof pasuq, nun hafukha)
+NIQQUD = "\u0591-\u05bd\u05bf\u05c1\u05c2\u05c4\u05c5\u05c7"
+MAQAF = "\u05be"
+HEBREW_PREFIXES = "והבכלמש"
+FINAL_LETTERS = str.maketrans("ךםןףץ", "כמנפצ")
+
+# Name of the analyzer registered on the index, and of the indexed-only field
+# holding the normalized text of each document
+HEBREW_ANALYZER = "hebrew"
+NORMALIZED_TEXT_FIELD = "text_he"
+
+_NIQQUD_RE = re.compile(f"[{NIQQUD}]")
+# Single translation table applying all of normalize_hebrew in one pass
+_NORMALIZE_TABLE = {
+    **{code: None for code in range(0x0591, 0x05c8) if _NIQQUD_RE.match(chr(code))},
+    **FINAL_LETTERS,
+    ord(MAQAF): " ",
+}
+_FINAL_FORMS = dict(zip("כמנפצ", "ךםןףץ"))
+_NUMERAL_LETTERS = [(400, "ת"), (300, "ש"), (200, "ר"), (100, "ק"), (90, "צ"), (80, "פ"), (70, "ע"), (60, "ס"),
+                    (50, "נ"), (40, "מ"), (30, "ל"), (20, "כ"), (10, "י"), (9, "ט"), (8, "ח"), (7, "ז"),
+                    (6, "ו"), (5, "ה"), (4, "ד"), (3, "ג"), (2, "ב"), (1, "א")]
+_NUMERAL_VALUES = {letter: value for value, letter in _NUMERAL_LETTERS}
+_HEBREW_WORD = re.compile(r"^[\u05d0-\u05ea]{2,}$")
+_QUERY_KEYWORDS = {"AND", "OR", "NOT", "TO", "IN"}
+# A quoted phrase or a bare term, each with an optional field name, modifier and boost/slop
+_QUERY_TOKEN = re.compile(
+    r'(?P<modifier>[+-]?)(?:(?P<field>\w+):)?'
+    r'(?P<term>"(?:\\.|[^"\\])*"|[^\s()"^~:]+)'
+    r'(?P<suffix>(?:[\^~][\d.]*)*)'
+)
+_UNESCAPED_QUOTE = re.compile(r'(?<!\\)"')
+
+
+def strip_niqqud(text: str) -> str:
+    """Remove Hebrew vowel points and cantillation marks from text"""
+    return _NIQQUD_RE.sub("", text)
+
+
+def normalize_hebrew(text: str) -> str:
+    """Normalize Hebrew text for indexing and querying.
+
+    Removes niqqud and cantillation, turns final letters into their regular
+    form and splits words joined by a maqaf.
+    """
+    return text.translate(_NORMALIZE_TABLE)
+
+
+def restore_final_letter(word: str) -> str:
+    """Give a normalized word its final letter form back, for display"""
+    if word and word[-1] in _FINAL_FORMS:
+        return word[:-1] + _FINAL_FORMS[word[-1]]
+    return word
+
+
+def hebrew_numeral(number: int) -> str:
+    """Write a positive number in Hebrew letters the way references do, e.g. 15 -> טו, 120 -> קכ"""
+    letters = []
+    thousands, number = divmod(number, 1000)
+    if thousands:
+        letters.append(hebrew_numeral(thousands))
+    while number >= 400:
+        letters.append("ת")
+        number -= 400
+    for value, letter in _NUMERAL_LETTERS:
+        if value < 100 and number in (15, 16):
+            # Written 9 + 6 and 9 + 7 to avoid spelling the divine name
+            letters.append("טו" if number == 15 else "טז")
+            break
+        if number >= value:
+            letters.append(letter)
+            number -= value
+    return "".join(letters)
+
+
+def parse_hebrew_numeral(text: str) -> Optional[int]:
+    """Return the value of a number written in Hebrew letters, ignoring geresh and gershayim, or None"""
+    text = text.replace("'", "").replace('"', "").replace("\u05f3", "").replace("\u05f4", "")
+    text = text.translate(FINAL_LETTERS)
+    if not text or any(letter not in _NUMERAL_VALUES for letter in text):
+        return None
+    return sum(_NUMERAL_VALUES[letter] for letter in text)
+
+
+def hebrew_analyzer():
+    """Return the analyzer used for normalized Hebrew fields"""
+    return (
+        TextAnalyzerBuilder(Tokenizer.simple())
+        .filter(Filter.remove_long(40))
+        .filter(Filter.lowercase())
+        .build()
+    )
+
+
+def register_hebrew_analyzer(index):
+    """Register the Hebrew analyzer on an index; needed every time the index is opened"""
+    index.register_tokenizer(HEBREW_ANALYZER, hebrew_analyzer())
+
+
+def add_hebrew_fields(schema_builder):
+    """Add the normalized text field to a schema being built"""
+    schema_builder.add_text_field(NORMALIZED_TEXT_FIELD, stored=False, tokenizer_name=HEBREW_ANALYZER,
+                                  index_option="position")
+    return schema_builder
+
+
+def prefix_variants(word: str) -> List[str]:
+    """Return the word followed by its forms with the common Hebrew prefixes.
+
+    Covers a single prefix letter and vav followed by another prefix letter.
+    """
+    variants = [word]
+    for prefix in HEBREW_PREFIXES:
+        variants.append(prefix + word)
+        if prefix != "ו":
+            variants.append("ו" + prefix + word)
+    return variants
+
+
+def prefix_stems(word: str) -> List[str]:
+    """Return the word with one or two leading prefix letters removed"""
+    stems = []
+    for length in (1, 2):
+        stem = word[length:]
+        if len(stem) > 1 and all(letter in HEBREW_PREFIXES for letter in word[:length]):
+            stems.append(stem)
+    return stems
+
+
+def rewrite_query(query: str, field_map: Optional[dict] = None,
+                  term_exists: Optional[Callable[[str, str], bool]] = None) -> str:
+    """Rewrite a query to target the normalized Hebrew field.
+
+    Fields in field_map (text -> text_he by default) are renamed, their terms
+    and phrases normalized, and plain Hebrew terms expanded to their prefix
+    variants. Terms without a field keep their original form as well, so they
+    still match the other fields. term_exists(field, term) prunes variants
+    that do not occur in the index; when given, a term that does not occur
+    itself is also tried without its leading prefix letters.
+
+    Queries with an unclosed quote or unbalanced parentheses are returned
+    unchanged, since their expansions would end up inside the open phrase.
+    """
+    if len(_UNESCAPED_QUOTE.findall(query)) % 2 or query.count("(") != query.count(")"):
+        return query
+    if field_map is None:
+        field_map = {"text": NORMALIZED_TEXT_FIELD}
+    normalized_fields = set(field_map.values())
+
+    def rewrite(match) -> str:
+        modifier, field, term, suffix = match.group("modifier", "field", "term", "suffix")
+        if field is None and term in _QUERY_KEYWORDS:
+            return match.group(0)
+        field = field_map.get(field, field)
+        if field is not None and field not in normalized_fields:
+            return match.group(0)
+        prefix = f"{modifier}{field}:" if field else modifier
+        normalized = normalize_hebrew(term)
+        if term.startswith('"') or "*" in term or "?" in term or not _HEBREW_WORD.match(normalized):
+            variants = [normalized]
+        else:
+            lookup_field = field or NORMALIZED_TEXT_FIELD
+            variants = [normalized] + [
+                variant for variant in prefix_variants(normalized)[1:]
+                if term_exists is None or term_exists(lookup_field, variant)
+            ]
+            # A word missing from the index may carry a prefix itself, try its stems
+            if term_exists is not None and not term_exists(lookup_field, normalized):
+                variants += [stem for stem in prefix_stems(normalized) if term_exists(lookup_field, stem)]
+        if field is None and term != normalized:
+            variants.insert(0, term)
+        if len(variants) == 1:
+            return f"{prefix}{variants[0]}{suffix}"
+        return f"{prefix}({' OR '.join(variants)}){suffix}"
+
+    return _QUERY_TOKEN.sub(rewrite, query)
@@ -0,0 +1,109 @@
+from typing import List, Tuple
+import re
+from hebrew import HEBREW_PREFIXES, NIQQUD, strip_niqqud
+
+
+_QUERY_SYNTAX = re.compile(r'[\^~][\d.]*|[:"()[\]{}*?\\]|\b(AND|OR|NOT|TO|IN)\b|[-+]')
+_FIELD_NAME = re.compile(r'\b\w+:')
+_EXCLUDED = re.compile(r'(?:^|(?<=\s))-\S+|\bNOT\s+[^\s()]+')
+
+
+def query_terms(query: str) -> List[str]:
+    """Extract the plain search terms from a query, dropping syntax, field names and excluded terms"""
+    query = _EXCLUDED.sub(" ", query)
+    terms = _QUERY_SYNTAX.sub(" ", _FIELD_NAME.sub(" ", query)).split()
+    seen = set()
+    result = []
+    for term in terms:
+        term = strip_niqqud(term)
+        if len(term) > 1 and term not in seen:
+            seen.add(term)
+            result.append(term)
+    return result
+
+
+class Highlighter:
+    """Extract snippets around query terms, compiled once per query.
+
+    Terms match at the start of a word, optionally behind Hebrew prefix
+    letters, whether or not the text carries niqqud. Matches are extended to
+    the end of their word, overlapping windows are merged up to
+    max_fragment_length characters, and at most max_fragments snippets are
+    returned, so scanning stops early on long texts with many matches.
+    """
+
+    def __init__(self, query: str, context: int = 50, max_fragments: int = 5,
+                 max_fragment_length: int = 300, fallback_length: int = 100):
+        self.context = context
+        self.max_fragments = max_fragments
+        self.max_fragment_length = max_fragment_length
+        self.fallback_length = fallback_length
+        self.terms = query_terms(query)
+        self.pattern = None
+        if self.terms:
+            marks = f"[{NIQQUD}]*"
+            # Longest terms first so the alternation prefers the most specific match
+            alternatives = [
+                marks.join(re.escape(char) for char in term)
+                for term in sorted(self.terms, key=len, reverse=True)
+            ]
+            self.pattern = re.compile(
+                f"(?<![\\w{NIQQUD}])(?:[{HEBREW_PREFIXES}]{marks}){{0,2}}"
+                f"(?:{'|'.join(alternatives)})[\\w{NIQQUD}]*",
+                re.IGNORECASE,
+            )
+
+    def windows(self, text: str) -> List[Tuple[int, int]]:
+        """Return merged (start, end) offsets of the snippets for text"""
+        windows: List[Tuple[int, int]] = []
+        if self.pattern is None:
+            return windows
+        length = len(text)
+        for match in self.pattern.finditer(text):
+            start = self._word_start(text, max(0, match.start() - self.context))
+            end = self._word_end(text, min(length, match.end() + self.context))
+            if windows and start <= windows[-1][1]:
+                if end - windows[-1][0] <= self.max_fragment_length:
+                    windows[-1] = (windows[-1][0], max(end, windows[-1][1]))
+                    continue
+                if match.start() < windows[-1][1]:
+                    # The match is already shown in the previous fragment
+                    continue
+                start = windows[-1][1]
+            if len(windows) == self.max_fragments:
+                break
+            windows.append((start, end))
+        return windows
+
+    def highlight(self, text: str) -> List[str]:
+        """Return the snippets of text around the query terms"""
+        if not text:
+            return [text] if text is not None else []
+        windows = self.windows(text)
+        if not windows:
+            return [text[:self.fallback_length] + "..." if len(text) > self.fallback_length else text]
+        highlights = []
+        for start, end in windows:
+            highlight = text[start:end]
+            if start > 0:
+                highlight = f"...{highlight}"
+            if end < len(text):
+                highlight = f"{highlight}..."
+            highlights.append(highlight)
+        return highlights
+
+    @staticmethod
+    def _word_start(text: str, position: int, slack: int = 20) -> int:
+        """Move position back to the start of the word it falls in"""
+        limit = max(0, position - slack)
+        while position > limit and not text[position - 1].isspace():
+            position -= 1
+        return position
+
+    @staticmethod
+    def _word_end(text: str, position: int, slack: int = 20) -> int:
+        """Move position forward to the end of the word it falls in"""
+        limit = min(len(text), position + slack)
+        while position < limit and not text[position].isspace():
+            position += 1
+        return position
@@ -0,0 +1,240 @@
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from functools import partial
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence
+from tantivy import Document, Index, SchemaBuilder
+from hebrew import NORMALIZED_TEXT_FIELD, add_hebrew_fields, normalize_hebrew, register_hebrew_analyzer
+from tantivy_search import quote_term
+import argparse
+import json
+import logging
+import os
+import time
+
+
+SOURCE_EXTENSIONS = (".txt", ".json", ".jsonl")
+
+
+def build_schema(hebrew: bool = True):
+    """Return the schema of the search index, with the normalized Hebrew field if hebrew is set"""
+    builder = SchemaBuilder()
+    builder.add_text_field("text", stored=True)
+    builder.add_text_field("reference", stored=True)
+    # Raw and fast, so that facets count whole topics and titles rather than their words
+    builder.add_text_field("topics", stored=True, tokenizer_name="raw", fast=True)
+    builder.add_text_field("title", stored=True, tokenizer_name="raw", fast=True)
+    # Raw, so that documents can be replaced or deleted by their exact path
+    builder.add_text_field("filePath", stored=True, tokenizer_name="raw")
+    builder.add_integer_field("segment", stored=True, indexed=True, fast=True)
+    builder.add_boolean_field("isPdf", stored=True)
+    if hebrew:
+        add_hebrew_fields(builder)
+    return builder.build()
+
+
+def iter_source_files(sources: Iterable[str]) -> Iterator[str]:
+    """Yield the source files found in the given files and directories, in a stable order"""
+    for source in sources:
+        if os.path.isdir(source):
+            for directory, dirnames, filenames in os.walk(source):
+                dirnames.sort()
+                for filename in sorted(filenames):
+                    if filename.endswith(SOURCE_EXTENSIONS):
+                        yield os.path.join(directory, filename)
+        else:
+            yield source
+
+
+def source_file_path(path: str, root: Optional[str] = None) -> str:
+    """Return the file path stored in the index for a source file"""
+    return os.path.relpath(path, root) if root else path
+
+
+def parse_source(path: str, root: Optional[str] = None, hebrew: bool = True) -> List[Dict[str, Any]]:
+    """Parse a source file into index documents.
+
+    Text files give one document per non-empty line, titled after the file
+    and with each directory below root as a topic. JSON files hold a list of
+    documents and JSONL files one document per line, using the index field
+    names (topics as a list or a single topic); missing fields are filled in
+    the same way as for text files.
+    """
+    file_path = source_file_path(path, root)
+    title = os.path.splitext(os.path.basename(path))[0]
+    directory = os.path.dirname(file_path) if root else os.path.basename(os.path.dirname(path))
+    topics = [part for part in directory.split(os.sep) if part]
+    with open(path, encoding="utf-8") as f:
+        if path.endswith(".json"):
+            records = json.load(f)
+        elif path.endswith(".jsonl"):
+            records = [json.loads(line) for line in f if line.strip()]
+        else:
+            records = [{"text": line.strip()} for line in f if line.strip()]
+
+    documents = []
+    for segment, record in enumerate(records):
+        record_topics = record.get("topics") or topics
+        document = {
+            "text": record.get("text", ""),
+            "title": record.get("title") or title,
+            "topics": [record_topics] if isinstance(record_topics, str) else list(record_topics),
+            "filePath": record.get("filePath") or file_path,
+            "segment": int(record.get("segment", segment)),
+            "isPdf": bool(record.get("isPdf", False)),
+        }
+        document["reference"] = record.get("reference") or f"{document['title']} {document['segment'] + 1}"
+        if hebrew:
+            document[NORMALIZED_TEXT_FIELD] = normalize_hebrew(document["text"])
+        documents.append(document)
+    return documents
+
+
+class IndexBuilder:
+    def __init__(self, index_path: str, heap_size: int = 512 * 1024 * 1024, num_threads: int = 0,
+                 parse_workers: Optional[int] = None, root: Optional[str] = None, hebrew: bool = True):
+        """Create or open the index at index_path for writing.
+
+        heap_size and num_threads configure the tantivy writer (0 threads lets
+        tantivy decide), parse_workers the number of processes parsing source
+        files. File paths are stored relative to root when it is given. A new
+        index gets the normalized Hebrew field if hebrew is set; an existing
+        index keeps its schema.
+        """
+        self.index_path = index_path
+        self.heap_size = heap_size
+        self.num_threads = num_threads
+        self.parse_workers = parse_workers
+        self.root = root
+        self.logger = logging.getLogger(__name__)
+        os.makedirs(index_path, exist_ok=True)
+        if Index.exists(index_path):
+            self.index = Index.open(index_path)
+        else:
+            self.index = Index(build_schema(hebrew), index_path)
+        register_hebrew_analyzer(self.index)
+        with open(os.path.join(index_path, "meta.json"), encoding="utf-8") as f:
+            fields = {field["name"]: field for field in json.load(f).get("schema", [])}
+        self.hebrew = NORMALIZED_TEXT_FIELD in fields
+        file_path_options = fields.get("filePath", {}).get("options", {})
+        self.raw_file_path = (file_path_options.get("indexing") or {}).get("tokenizer") == "raw"
+
+    def build(self, sources: Sequence[str]) -> Dict[str, Any]:
+        """Replace the contents of the index with the documents of the given sources"""
+        return self._write(sources, replace_all=True)
+
+    def update(self, sources: Sequence[str] = (), deleted: Sequence[str] = ()) -> Dict[str, Any]:
+        """Re-index the given sources and remove the documents of the deleted file paths.
+
+        Documents already indexed for a source file are replaced, so a
+        changed file can simply be passed again.
+        """
+        return self._write(sources, deleted=deleted)
+
+    def merge(self) -> int:
+        """Let the writer finish merging segments and return the resulting segment count.
+
+        The Python bindings do not expose explicit merges, so this commits
+        and waits for the merges scheduled by tantivy's merge policy.
+        """
+        writer = self.index.writer(self.heap_size, self.num_threads)
+        writer.commit()
+        writer.wait_merging_threads()
+        return self._segment_count()
+
+    def _write(self, sources: Sequence[str], deleted: Sequence[str] = (), replace_all: bool = False) -> Dict[str, Any]:
+        start = time.monotonic()
+        writer = self.index.writer(self.heap_size, self.num_threads)
+        if replace_all:
+            writer.delete_all_documents()
+        for file_path in deleted:
+            self._delete_file(writer, file_path)
+
+        parse = partial(parse_source, root=self.root, hebrew=self.hebrew)
+        # Files parsed ahead of the writer, so parsed documents never pile up in memory
+        max_pending = 2 * (self.parse_workers or os.cpu_count() or 1)
+        num_files = num_docs = 0
+        with ProcessPoolExecutor(max_workers=self.parse_workers) as executor:
+            pending = {}
+            for path in iter_source_files(sources):
+                pending[executor.submit(parse, path)] = path
+                num_files += 1
+                if len(pending) >= max_pending:
+                    num_docs += self._add_parsed(writer, pending, replace_all)
+            while pending:
+                num_docs += self._add_parsed(writer, pending, replace_all)
+        writer.commit()
+        writer.wait_merging_threads()
+
+        elapsed = time.monotonic() - start
+        stats = {
+            "files": num_files,
+            "docs": num_docs,
+            "deleted_files": len(deleted),
+            "seconds": elapsed,
+            "docs_per_sec": num_docs / elapsed if elapsed else 0.0,
+            "segments": self._segment_count(),
+        }
+        self.logger.info(f"Indexed {num_docs} documents from {num_files} files in {elapsed:.1f}s "
+                         f"({stats['docs_per_sec']:.0f} docs/s), {stats['segments']} segments")
+        return stats
+
+    def _add_parsed(self, writer, pending: Dict[Any, str], replace_all: bool) -> int:
+        """Wait for parsed files, add their documents and return how many were added.
+
+        pending maps parse futures to their source paths; finished ones are
+        removed from it. Unless the whole index is rebuilt, the documents
+        previously indexed for the files are deleted first.
+        """
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        num_docs = 0
+        for future in done:
+            path = pending.pop(future)
+            documents = future.result()
+            if not replace_all:
+                file_paths = {document["filePath"] for document in documents}
+                for file_path in file_paths | {source_file_path(path, self.root)}:
+                    self._delete_file(writer, file_path)
+            for document in documents:
+                writer.add_document(Document(**document))
+            num_docs += len(documents)
+        return num_docs
+
+    def _delete_file(self, writer, file_path: str):
+        """Delete the documents of a file, by exact term when filePath is a raw field"""
+        if self.raw_file_path:
+            writer.delete_documents_by_term("filePath", file_path)
+        else:
+            writer.delete_documents_by_query(self.index.parse_query(f"filePath:{quote_term(file_path)}"))
+
+    def _segment_count(self) -> int:
+        self.index.reload()
+        return self.index.searcher().num_segments
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or update the search index from source files")
+    parser.add_argument("sources", nargs="*", help="text/JSON files or directories to index")
+    parser.add_argument("--index", default=os.getenv("INDEX_PATH", "./index"), help="index directory")
+    parser.add_argument("--root", help="directory file paths are stored relative to")
+    parser.add_argument("--update", action="store_true", help="replace only the given files instead of rebuilding")
+    parser.add_argument("--delete", nargs="*", default=[], help="file paths to remove from the index")
+    parser.add_argument("--merge", action="store_true", help="wait for segment merges to finish")
+    parser.add_argument("--heap-size", type=int, default=512, help="writer heap size in MB")
+    parser.add_argument("--threads", type=int, default=0, help="writer threads (0: automatic)")
+    parser.add_argument("--workers", type=int, default=None, help="parsing processes")
+    parser.add_argument("--no-hebrew", action="store_true", help="create the index without the normalized Hebrew field")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    builder = IndexBuilder(args.index, args.heap_size * 1024 * 1024, args.threads, args.workers,
+                           args.root, hebrew=not args.no_hebrew)
+    if args.update or args.delete:
+        stats = builder.update(args.sources, args.delete)
+    else:
+        stats = builder.build(args.sources)
+    if args.merge:
+        stats["segments"] = builder.merge()
+    print(json.dumps(stats, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,365 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+from urllib.parse import urljoin
+import hashlib
+import json
+import logging
+import os
+import shutil
+import struct
+import zipfile
+import zlib
+import requests
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+TIMEOUT = (10, 60)
+
+
+class DownloadError(Exception):
+    pass
+
+
+def _sha256_of(path: str) -> "hashlib._Hash":
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest
+
+
+def download_file(url: str, dest: str, sha256: Optional[str] = None, size: Optional[int] = None,
+                  session: Optional[requests.Session] = None) -> str:
+    """Download url to dest, resuming a previous partial download.
+
+    Data is streamed to dest + ".part", continuing with a Range request when
+    that file exists, and only renamed to dest once the size and SHA-256
+    checksum (when given) match. A finished dest that already matches is
+    not downloaded again. A partial file the server cannot continue (416)
+    that does not match is deleted and downloaded again from the start.
+    """
+    session = session or requests.Session()
+    if os.path.exists(dest) and (sha256 is None or _sha256_of(dest).hexdigest() == sha256):
+        return dest
+    os.makedirs(os.path.dirname(dest) or ".", exist_ok=True)
+    part_path = dest + ".part"
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    if size is not None and offset > size:
+        offset = 0
+    digest = _sha256_of(part_path) if offset else hashlib.sha256()
+
+    headers = {"Range": f"bytes={offset}-"} if offset else {}
+    with session.get(url, headers=headers, stream=True, timeout=TIMEOUT) as response:
+        # 416 means the partial file is at least as long as the content, e.g. after a crash before the
+        # rename; it is complete if its size or, when the size is unknown, its checksum matches
+        unsatisfiable = response.status_code == 416 and offset
+        complete = unsatisfiable and (offset == size if size is not None
+                                      else sha256 is not None and digest.hexdigest() == sha256)
+        if not unsatisfiable:
+            response.raise_for_status()
+            if offset and response.status_code != 206:
+                # The server ignored the range, start over
+                offset = 0
+                digest = hashlib.sha256()
+            with open(part_path, "ab" if offset else "wb") as f:
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    f.write(chunk)
+                    digest.update(chunk)
+    if unsatisfiable and not complete:
+        logger.warning(f"{url}: partial download does not match, starting over")
+        os.remove(part_path)
+        return download_file(url, dest, sha256, size, session)
+
+    actual_size = os.path.getsize(part_path)
+    if size is not None and actual_size != size:
+        raise DownloadError(f"{url}: expected {size} bytes, got {actual_size}")
+    if sha256 is not None and digest.hexdigest() != sha256:
+        os.remove(part_path)
+        raise DownloadError(f"{url}: checksum mismatch")
+    os.replace(part_path, dest)
+    return dest
+
+
+def fetch_manifest(url: str, session: Optional[requests.Session] = None) -> Dict[str, Any]:
+    """Fetch an index manifest: {"files": [{"path", "sha256", "size"}, ...]}.
+
+    File paths are relative to the index directory and resolved against the
+    manifest URL.
+    """
+    session = session or requests.Session()
+    response = session.get(url, timeout=TIMEOUT)
+    response.raise_for_status()
+    manifest = response.json()
+    if not isinstance(manifest.get("files"), list):
+        raise DownloadError(f"{url}: manifest has no file list")
+    return manifest
+
+
+def download_index(manifest_url: str, index_path: str, workers: int = 4) -> str:
+    """Download the index files listed in a manifest and swap them in.
+
+    Files are fetched concurrently straight into a staging directory next to
+    index_path, each verified against its checksum as it completes, so no
+    archive copy is kept. The staging directory survives failures, letting a
+    later call resume where this one stopped.
+    """
+    session = requests.Session()
+    manifest = fetch_manifest(manifest_url, session)
+    staging_path = _staging_path(index_path)
+
+    def fetch(entry: Dict[str, Any]) -> str:
+        relative_path = os.path.normpath(entry["path"])
+        if relative_path.startswith("..") or os.path.isabs(relative_path):
+            raise DownloadError(f"Unsafe path in manifest: {entry['path']}")
+        return download_file(urljoin(manifest_url, entry["path"]), os.path.join(staging_path, relative_path),
+                             entry.get("sha256"), entry.get("size"), session)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(fetch, manifest["files"]))
+    logger.info(f"Downloaded {len(manifest['files'])} index files from {manifest_url}")
+    swap_directory(staging_path, index_path)
+    return index_path
+
+
+def download_index_archive(url: str, index_path: str, sha256: Optional[str] = None, workers: int = 4) -> str:
+    """Download a zipped index, extracting it as it arrives, and swap it in.
+
+    Entries are read from the response stream one local header at a time and
+    written straight into a staging directory next to index_path, each
+    checked against its CRC-32, so the archive itself is never stored. The
+    offset of the next entry is saved as entries complete, and an interrupted
+    download resumes from there with a Range request; the SHA-256 of the
+    whole archive (when given) can only be checked on an uninterrupted
+    download. A single top-level directory in the archive is dropped.
+
+    Archives the stream cannot be read from (encrypted entries, compression
+    other than deflate, or stored entries without sizes in their header) are
+    downloaded whole and extracted afterwards with the given number of
+    workers, which keeps the archive and the extracted index on disk at once.
+    """
+    staging_path = _staging_path(index_path)
+    try:
+        _stream_archive(url, staging_path, sha256)
+    except _Unstreamable as e:
+        logger.warning(f"{url}: {e}, downloading the archive before extracting it")
+        shutil.rmtree(staging_path, ignore_errors=True)
+        if os.path.exists(staging_path + ".progress"):
+            os.remove(staging_path + ".progress")
+        _download_archive(url, staging_path, sha256, workers)
+    entries = os.listdir(staging_path)
+    if len(entries) == 1 and os.path.isdir(os.path.join(staging_path, entries[0])):
+        swap_directory(os.path.join(staging_path, entries[0]), index_path)
+        shutil.rmtree(staging_path, ignore_errors=True)
+    else:
+        swap_directory(staging_path, index_path)
+    return index_path
+
+
+class _Unstreamable(Exception):
+    pass
+
+
+class _Stream:
+    """Exact-size reads over an iterator of chunks, hashing the chunks as they arrive"""
+
+    def __init__(self, chunks, offset: int = 0):
+        self.chunks = chunks
+        self.buffer = b""
+        self.offset = offset
+        self.digest = hashlib.sha256()
+
+    def read_some(self, limit: int = CHUNK_SIZE) -> bytes:
+        if not self.buffer:
+            self.buffer = next(self.chunks, b"")
+            self.digest.update(self.buffer)
+        data, self.buffer = self.buffer[:limit], self.buffer[limit:]
+        self.offset += len(data)
+        return data
+
+    def read(self, size: int) -> bytes:
+        parts = []
+        while size:
+            data = self.read_some(size)
+            if not data:
+                raise DownloadError("Archive ends in the middle of an entry")
+            parts.append(data)
+            size -= len(data)
+        return b"".join(parts)
+
+    def unread(self, data: bytes):
+        self.buffer = data + self.buffer
+        self.offset -= len(data)
+
+
+_LOCAL_HEADER = struct.Struct("<4sHHHHHIIIHH")
+_LOCAL_HEADER_SIGNATURE = b"PK\x03\x04"
+_DATA_DESCRIPTOR_SIGNATURE = b"PK\x07\x08"
+_ZIP64_EXTRA = 0x0001
+_FLAG_ENCRYPTED = 0x1
+_FLAG_DATA_DESCRIPTOR = 0x8
+
+
+def _stream_archive(url: str, staging_path: str, sha256: Optional[str] = None):
+    """Extract the zip at url into staging_path while downloading it.
+
+    Raises _Unstreamable on reaching an entry the stream cannot be read from.
+    """
+    progress_path = staging_path + ".progress"
+    offset = 0
+    if os.path.isdir(staging_path) and os.path.exists(progress_path):
+        with open(progress_path) as f:
+            progress = json.load(f)
+        if progress.get("url") == url:
+            offset = progress["offset"]
+    if not offset:
+        shutil.rmtree(staging_path, ignore_errors=True)
+
+    headers = {"Range": f"bytes={offset}-"} if offset else {}
+    with requests.get(url, headers=headers, stream=True, timeout=TIMEOUT) as response:
+        response.raise_for_status()
+        if offset and response.status_code != 206:
+            # The server ignored the range, start over
+            offset = 0
+            shutil.rmtree(staging_path, ignore_errors=True)
+        os.makedirs(staging_path, exist_ok=True)
+        stream = _Stream(response.iter_content(CHUNK_SIZE), offset)
+        count = 0
+        while _extract_entry(stream, staging_path):
+            count += 1
+            with open(progress_path, "w") as f:
+                json.dump({"url": url, "offset": stream.offset}, f)
+        if not count and not offset:
+            raise DownloadError(f"{url}: not a zip archive")
+        # The central directory is not needed, but is part of the checksum
+        while stream.read_some():
+            pass
+
+    if sha256 is not None:
+        if offset:
+            logger.warning(f"{url}: resumed download, entries checked by CRC-32 only")
+        elif stream.digest.hexdigest() != sha256:
+            shutil.rmtree(staging_path, ignore_errors=True)
+            if os.path.exists(progress_path):
+                os.remove(progress_path)
+            raise DownloadError(f"{url}: checksum mismatch")
+    if os.path.exists(progress_path):
+        os.remove(progress_path)
+    logger.info(f"Extracted {count} index files from {url}")
+
+
+def _extract_entry(stream: _Stream, staging_path: str) -> bool:
+    """Extract the entry starting at the stream position; False once the entries end"""
+    signature = stream.read_some(4)
+    if signature and len(signature) < 4:
+        signature += stream.read(4 - len(signature))
+    if signature != _LOCAL_HEADER_SIGNATURE:
+        stream.unread(signature)
+        return False
+    (_, _, flags, method, _, _, crc, compressed_size, size,
+     name_length, extra_length) = _LOCAL_HEADER.unpack(signature + stream.read(_LOCAL_HEADER.size - 4))
+    name = stream.read(name_length).decode("utf-8" if flags & 0x800 else "cp437")
+    extra = stream.read(extra_length)
+    zip64 = False
+    while len(extra) >= 4:
+        extra_id, extra_size = struct.unpack("<HH", extra[:4])
+        if extra_id == _ZIP64_EXTRA:
+            zip64 = True
+            if size == 0xFFFFFFFF and extra_size >= 16:
+                size, compressed_size = struct.unpack("<QQ", extra[4:20])
+        extra = extra[4 + extra_size:]
+
+    descriptor = bool(flags & _FLAG_DATA_DESCRIPTOR)
+    if flags & _FLAG_ENCRYPTED:
+        raise _Unstreamable(f"encrypted entry {name}")
+    if method not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+        raise _Unstreamable(f"unsupported compression in {name}")
+    if method == zipfile.ZIP_STORED and descriptor:
+        raise _Unstreamable(f"stored entry {name} without a size")
+
+    target = os.path.normpath(os.path.join(staging_path, name))
+    if not target.startswith(os.path.normpath(staging_path) + os.sep):
+        raise DownloadError(f"Unsafe path in archive: {name}")
+    if name.endswith("/"):
+        os.makedirs(target, exist_ok=True)
+        return True
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+
+    actual_crc = 0
+    with open(target, "wb") as dest:
+        if method == zipfile.ZIP_STORED:
+            remaining = compressed_size
+            while remaining:
+                data = stream.read(min(remaining, CHUNK_SIZE))
+                remaining -= len(data)
+                actual_crc = zlib.crc32(data, actual_crc)
+                dest.write(data)
+        else:
+            # Deflate marks its own end, so entries with a data descriptor need no sizes
+            decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+            remaining = None if descriptor else compressed_size
+            while not decompressor.eof:
+                data = stream.read_some(CHUNK_SIZE if remaining is None else min(remaining, CHUNK_SIZE))
+                if not data:
+                    raise DownloadError(f"Archive ends in the middle of {name}")
+                if remaining is not None:
+                    remaining -= len(data)
+                data = decompressor.decompress(data)
+                actual_crc = zlib.crc32(data, actual_crc)
+                dest.write(data)
+            stream.unread(decompressor.unused_data)
+    if descriptor:
+        crc = struct.unpack("<I", stream.read(4))[0]
+        if struct.pack("<I", crc) == _DATA_DESCRIPTOR_SIGNATURE:
+            crc = struct.unpack("<I", stream.read(4))[0]
+        stream.read(16 if zip64 else 8)
+    if actual_crc != crc:
+        raise DownloadError(f"CRC-32 mismatch in {name}")
+    return True
+
+
+def _download_archive(url: str, staging_path: str, sha256: Optional[str], workers: int):
+    """Download the zip at url whole, verify it and extract it into staging_path"""
+    archive_path = staging_path + ".zip"
+    download_file(url, archive_path, sha256)
+    if not zipfile.is_zipfile(archive_path):
+        os.remove(archive_path)
+        raise DownloadError(f"{url}: not a zip archive")
+
+    with zipfile.ZipFile(archive_path) as archive:
+        members = [info for info in archive.infolist() if not info.is_dir()]
+
+    def extract(chunk: List[zipfile.ZipInfo]):
+        # Each worker reads through its own handle to the archive
+        with zipfile.ZipFile(archive_path) as archive:
+            for info in chunk:
+                target = os.path.normpath(os.path.join(staging_path, info.filename))
+                if not target.startswith(os.path.normpath(staging_path) + os.sep):
+                    raise DownloadError(f"Unsafe path in archive: {info.filename}")
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                with archive.open(info) as source, open(target, "wb") as dest:
+                    shutil.copyfileobj(source, dest, CHUNK_SIZE)
+
+    chunks = [members[i::workers] for i in range(workers)]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(extract, chunks))
+    os.remove(archive_path)
+    logger.info(f"Extracted {len(members)} index files from {url}")
+
+
+def swap_directory(new_path: str, path: str):
+    """Replace the directory at path with new_path.
+
+    Both renames stay within the parent directory, so readers see either the
+    old or the new directory and never a partially written one.
+    """
+    old_path = path + ".old"
+    shutil.rmtree(old_path, ignore_errors=True)
+    if os.path.exists(path):
+        os.replace(path, old_path)
+    os.replace(new_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+
+def _staging_path(index_path: str) -> str:
+    return os.path.normpath(index_path) + ".download"
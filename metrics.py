@@ -0,0 +1,167 @@
+from bisect import bisect_left
+from typing import Dict, Sequence, Tuple
+import json
+import threading
+import time
+
+
+# Upper bounds of the histogram buckets, in seconds for timings
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 1000, 10_000, 100_000, 1_000_000)
+
+
+class _Histogram:
+    __slots__ = ("buckets", "counts", "count", "sum", "max")
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+
+class MetricsRegistry:
+    """A thread-safe registry of counters and histograms, exportable as JSON or Prometheus text.
+
+    Metrics are created on first use and identified by their name and labels.
+    """
+
+    def __init__(self, namespace: str = "ituria"):
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, tuple], float] = {}
+        self._histograms: Dict[Tuple[str, tuple], _Histogram] = {}
+        self._buckets: Dict[str, Sequence[float]] = {}
+
+    def set_buckets(self, name: str, buckets: Sequence[float]):
+        """Use buckets for the histogram name instead of DEFAULT_BUCKETS"""
+        self._buckets[name] = sorted(buckets)
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram(self._buckets.get(name, DEFAULT_BUCKETS))
+            histogram.observe(value)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def snapshot(self) -> Dict[str, list]:
+        """Return the current values: {"counters": [...], "histograms": [...]}"""
+        with self._lock:
+            counters = [{"name": name, "labels": dict(labels), "value": value}
+                        for (name, labels), value in sorted(self._counters.items())]
+            histograms = [
+                {"name": name, "labels": dict(labels), "count": h.count, "sum": h.sum, "max": h.max,
+                 "buckets": dict(zip([*map(str, h.buckets), "+Inf"], h.counts))}
+                for (name, labels), h in sorted(self._histograms.items())
+            ]
+        return {"counters": counters, "histograms": histograms}
+
+    def to_json(self) -> str:
+        return json.dumps(self.snapshot(), ensure_ascii=False)
+
+    def to_prometheus(self) -> str:
+        """Return the metrics in the Prometheus text exposition format"""
+        snapshot = self.snapshot()
+        lines = []
+        declared = set()
+
+        def declare(name: str, kind: str):
+            if name not in declared:
+                declared.add(name)
+                lines.append(f"# TYPE {name} {kind}")
+
+        for counter in snapshot["counters"]:
+            name = f"{self.namespace}_{counter['name']}"
+            declare(name, "counter")
+            lines.append(f"{name}{_format_labels(counter['labels'])} {counter['value']}")
+        for histogram in snapshot["histograms"]:
+            name = f"{self.namespace}_{histogram['name']}"
+            declare(name, "histogram")
+            cumulative = 0
+            for bound, count in histogram["buckets"].items():
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels({**histogram['labels'], 'le': bound})} {cumulative}")
+            labels = _format_labels(histogram["labels"])
+            lines.append(f"{name}_sum{labels} {histogram['sum']}")
+            lines.append(f"{name}_count{labels} {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels: Dict[str, object]) -> str:
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+               for value in labels.values())
+    return "{" + ",".join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + "}"
+
+
+class _Span:
+    __slots__ = ("trace", "phase", "start")
+
+    def __init__(self, trace: "SearchTrace", phase: str):
+        self.trace = trace
+        self.phase = phase
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        phases = self.trace.phases
+        phases[self.phase] = phases.get(self.phase, 0.0) + time.perf_counter() - self.start
+
+
+class SearchTrace:
+    """Time spent in each phase of one search, summed over repeated spans of the same phase"""
+
+    enabled = True
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+
+    def span(self, phase: str) -> _Span:
+        return _Span(self, phase)
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc):
+        pass
+
+
+class _NullTrace:
+    """Stands in for SearchTrace when instrumentation is off, doing nothing"""
+
+    enabled = False
+    _span = _NullSpan()
+
+    def span(self, phase: str) -> _NullSpan:
+        return self._span
+
+
+NULL_TRACE = _NullTrace()
@@ -0,0 +1,232 @@
+from functools import lru_cache
+from typing import Dict, NamedTuple, Optional, Tuple
+from hebrew import FINAL_LETTERS, hebrew_numeral, parse_hebrew_numeral
+import re
+
+
+# (Sefaria title, Hebrew title, other names) of the books references are canonicalized for
+TANAKH_BOOKS = [
+    ("Genesis", "בראשית", ("Gen", "Bereshit", "Bereishit")),
+    ("Exodus", "שמות", ("Ex", "Exod", "Shemot")),
+    ("Leviticus", "ויקרא", ("Lev", "Vayikra")),
+    ("Numbers", "במדבר", ("Num", "Bamidbar")),
+    ("Deuteronomy", "דברים", ("Deut", "Devarim")),
+    ("Joshua", "יהושע", ("Josh",)),
+    ("Judges", "שופטים", ("Judg",)),
+    ("I Samuel", "שמואל א", ("1 Samuel", "1 Sam", "Samuel I")),
+    ("II Samuel", "שמואל ב", ("2 Samuel", "2 Sam", "Samuel II")),
+    ("I Kings", "מלכים א", ("1 Kings", "1 Kgs", "Kings I")),
+    ("II Kings", "מלכים ב", ("2 Kings", "2 Kgs", "Kings II")),
+    ("Isaiah", "ישעיהו", ("Isa", "ישעיה")),
+    ("Jeremiah", "ירמיהו", ("Jer", "ירמיה")),
+    ("Ezekiel", "יחזקאל", ("Ezek",)),
+    ("Hosea", "הושע", ("Hos",)),
+    ("Joel", "יואל", ()),
+    ("Amos", "עמוס", ()),
+    ("Obadiah", "עובדיה", ("Obad",)),
+    ("Jonah", "יונה", ()),
+    ("Micah", "מיכה", ("Mic",)),
+    ("Nahum", "נחום", ("Nah",)),
+    ("Habakkuk", "חבקוק", ("Hab",)),
+    ("Zephaniah", "צפניה", ("Zeph",)),
+    ("Haggai", "חגי", ("Hag",)),
+    ("Zechariah", "זכריה", ("Zech",)),
+    ("Malachi", "מלאכי", ("Mal",)),
+    ("Psalms", "תהלים", ("Ps", "Psalm", "Tehillim", "תהילים")),
+    ("Proverbs", "משלי", ("Prov", "Mishlei")),
+    ("Job", "איוב", ()),
+    ("Song of Songs", "שיר השירים", ("Song", "Song of Solomon", "Shir HaShirim")),
+    ("Ruth", "רות", ()),
+    ("Lamentations", "איכה", ("Lam", "Eichah")),
+    ("Ecclesiastes", "קהלת", ("Eccl", "Kohelet", "Koheles")),
+    ("Esther", "אסתר", ("Esth",)),
+    ("Daniel", "דניאל", ("Dan",)),
+    ("Ezra", "עזרא", ()),
+    ("Nehemiah", "נחמיה", ("Neh",)),
+    ("I Chronicles", "דברי הימים א", ("1 Chronicles", "1 Chr", "Chronicles I")),
+    ("II Chronicles", "דברי הימים ב", ("2 Chronicles", "2 Chr", "Chronicles II")),
+]
+# Tractates of the Babylonian Talmud, addressed by daf and amud (2a, 2b, ...)
+TALMUD_TRACTATES = [
+    ("Berakhot", "ברכות", ("Berachot",)),
+    ("Shabbat", "שבת", ("Shabbos",)),
+    ("Eruvin", "עירובין", ()),
+    ("Pesachim", "פסחים", ()),
+    ("Yoma", "יומא", ()),
+    ("Sukkah", "סוכה", ()),
+    ("Beitzah", "ביצה", ("Beitza",)),
+    ("Rosh Hashanah", "ראש השנה", ()),
+    ("Taanit", "תענית", ()),
+    ("Megillah", "מגילה", ()),
+    ("Moed Katan", "מועד קטן", ()),
+    ("Chagigah", "חגיגה", ()),
+    ("Yevamot", "יבמות", ()),
+    ("Ketubot", "כתובות", ()),
+    ("Nedarim", "נדרים", ()),
+    ("Nazir", "נזיר", ()),
+    ("Sotah", "סוטה", ()),
+    ("Gittin", "גיטין", ()),
+    ("Kiddushin", "קידושין", ()),
+    ("Bava Kamma", "בבא קמא", ()),
+    ("Bava Metzia", "בבא מציעא", ()),
+    ("Bava Batra", "בבא בתרא", ()),
+    ("Sanhedrin", "סנהדרין", ()),
+    ("Makkot", "מכות", ()),
+    ("Shevuot", "שבועות", ()),
+    ("Avodah Zarah", "עבודה זרה", ()),
+    ("Horayot", "הוריות", ()),
+    ("Zevachim", "זבחים", ()),
+    ("Menachot", "מנחות", ()),
+    ("Chullin", "חולין", ()),
+    ("Bekhorot", "בכורות", ()),
+    ("Arakhin", "ערכין", ()),
+    ("Temurah", "תמורה", ()),
+    ("Keritot", "כריתות", ()),
+    ("Meilah", "מעילה", ()),
+    ("Tamid", "תמיד", ()),
+    ("Niddah", "נדה", ()),
+]
+# Words that only label the parts of a reference, e.g. בראשית פרק א פסוק א
+LABEL_WORDS = {"פרק", "פסוק", "פסוקים", "דף", "עמוד", "משנה", "הלכה", "סימן", "סעיף",
+               "chapter", "verse", "verses", "daf", "ch", "v"}
+# The longest book name in words
+MAX_TITLE_WORDS = 4
+
+_QUOTES = re.compile("[\"'׳״]")
+_ADDRESS_TOKEN = re.compile(r"\d+[ab]?|[a-zA-Zא-ת]+|[.:]")
+_NUMBER = re.compile(r"(\d+)([ab])?")
+_RANGE = re.compile(r"\s*[-–—]\s*")
+# Sefaria's dotted form, e.g. Genesis.1.1
+_DOTTED = re.compile(r"(?<=[a-zA-Z])\.(?=\d)")
+_AMUDIM = {"א": "a", "ב": "b", "עא": "a", "עב": "b", "a": "a", "b": "b"}
+
+
+class Book(NamedTuple):
+    title: str
+    he_title: str
+    talmud: bool
+
+
+class Reference(NamedTuple):
+    """A parsed reference: the book and the sections of its start and, for a range, its end"""
+    book: Book
+    start: Tuple[str, ...]
+    end: Optional[Tuple[str, ...]] = None
+
+
+def _title_key(title: str) -> str:
+    return " ".join(_QUOTES.sub("", title).replace(".", " ").split()).lower()
+
+
+def _build_aliases() -> Dict[str, Book]:
+    aliases = {}
+    for books, talmud in ((TANAKH_BOOKS, False), (TALMUD_TRACTATES, True)):
+        for title, he_title, other_names in books:
+            book = Book(title, he_title, talmud)
+            for name in (title, he_title, *other_names):
+                aliases[_title_key(name)] = book
+    return aliases
+
+
+BOOK_ALIASES = _build_aliases()
+
+
+def _parse_sections(text: str, talmud: bool) -> Optional[Tuple[str, ...]]:
+    """Parse the part of a reference after the book into its sections, e.g. ("1", "3") or ("2a", "5")"""
+    tokens = [token for token in _ADDRESS_TOKEN.findall(_QUOTES.sub("", text)) if token.lower() not in LABEL_WORDS]
+    numbers = []
+    amud = None
+    for i, token in enumerate(tokens):
+        on_daf = talmud and len(numbers) == 1 and amud is None
+        if token in (".", ":"):
+            # Right after a daf, a period marks amud a and a final colon amud b
+            if on_daf and token == ".":
+                amud = "a"
+            elif on_daf and i == len(tokens) - 1:
+                amud = "b"
+            continue
+        if on_daf and token.lower() in _AMUDIM:
+            amud = _AMUDIM[token.lower()]
+            continue
+        match = _NUMBER.fullmatch(token)
+        if match:
+            numbers.append(int(match.group(1)))
+            if match.group(2) and talmud and len(numbers) == 1:
+                amud = match.group(2)
+            continue
+        value = parse_hebrew_numeral(token)
+        # Only numerals spelled the usual way, so that words are not read as numbers
+        if value is None or hebrew_numeral(value) != token.translate(FINAL_LETTERS):
+            return None
+        numbers.append(value)
+    sections = [str(number) for number in numbers]
+    if talmud and sections and amud:
+        sections[0] += amud
+    return tuple(sections)
+
+
+@lru_cache(maxsize=65536)
+def parse_reference(text: str) -> Optional[Reference]:
+    """Parse a reference to a known book, in Hebrew or English, or return None.
+
+    Accepts Hebrew or Arabic numerals with any of ":", ",", "." or spaces
+    between them, labels such as פרק and פסוק, daf and amud in the usual
+    forms (2a, ב., ב:, ב ע"א, דף ב עמוד א) and ranges such as 1:1-3 or
+    1:31-2:3.
+    """
+    words = _DOTTED.sub(" ", text).split()
+    for length in range(min(MAX_TITLE_WORDS, len(words)), 0, -1):
+        book = BOOK_ALIASES.get(_title_key(" ".join(words[:length])))
+        if book is not None:
+            break
+    else:
+        return None
+    address = " ".join(words[length:])
+    start_text, _, end_text = _RANGE.sub("-", address).partition("-")
+    start = _parse_sections(start_text, book.talmud)
+    if start is None:
+        return None
+    end = None
+    if end_text:
+        end = _parse_sections(end_text, book.talmud)
+        if not end or not start:
+            return None
+        # A shortened end like the 3 of 1:1-3 continues the start's leading sections
+        end = start[:max(len(start) - len(end), 0)] + end
+        if end == start:
+            end = None
+    return Reference(book, start, end)
+
+
+def format_reference(reference: Reference, hebrew: bool = False) -> str:
+    """Write a parsed reference in Sefaria's form, e.g. Genesis 1:31-2:3, or in Hebrew, e.g. בראשית א:לא-ב:ג"""
+    def sections(parts: Tuple[str, ...]) -> str:
+        if not hebrew:
+            return ":".join(parts)
+        written = []
+        for part in parts:
+            number = int(part.rstrip("ab"))
+            written.append(hebrew_numeral(number) + ({"a": " א", "b": " ב"}.get(part[-1], "")))
+        return ":".join(written)
+
+    title = reference.book.he_title if hebrew else reference.book.title
+    text = f"{title} {sections(reference.start)}".strip()
+    if reference.end:
+        common = 0
+        while common < len(reference.start) - 1 and reference.start[common] == reference.end[common]:
+            common += 1
+        text += "-" + sections(reference.end[common:])
+    return text
+
+
+@lru_cache(maxsize=65536)
+def canonical_reference(text: str, hebrew: bool = False) -> str:
+    """Return the canonical form of a reference, used as its cache key and to look it up.
+
+    References to known books are written in Sefaria's English form (or in
+    Hebrew if hebrew is set); others are returned with whitespace collapsed.
+    """
+    reference = parse_reference(text.strip())
+    if reference is None:
+        return " ".join(text.split())
+    return format_reference(reference, hebrew)
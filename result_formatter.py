@@ -0,0 +1,56 @@
+from typing import Any, Dict, List
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Rough average for the mixed Hebrew/Aramaic text of the corpus
+CHARS_PER_TOKEN = 3
+SNIPPET_SEPARATOR = " ... "
+# Characters of JSON punctuation and keys around every serialized hit
+ENTRY_OVERHEAD = len('{"reference": "", "text": ""}, ')
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the number of LLM tokens a piece of text will take"""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def format_results(results: List[Dict[str, Any]], max_tokens: int = 2000) -> List[Dict[str, str]]:
+    """Format search results for the LLM within a token budget.
+
+    Every hit first gets an equal share of the budget for its snippets (the
+    "highlights" of the result). The budget left over is then spent, in rank
+    order, on replacing snippets by the full text of hits that fit. Each hit
+    is serialized as just its reference and text.
+    """
+    if not results:
+        return []
+    budget = max_tokens * CHARS_PER_TOKEN
+    # Account for the reference and serialization of every hit up front
+    budget -= sum(len(result.get("reference") or "") + ENTRY_OVERHEAD for result in results)
+    share = max(budget // len(results), 0)
+
+    texts = []
+    for result in results:
+        snippets = result.get("highlights") or [result.get("text") or ""]
+        text = SNIPPET_SEPARATOR.join(snippets)
+        if len(text) > share:
+            text = text[:max(share - 3, 0)] + "..."
+        texts.append(text)
+
+    remaining = budget - sum(len(text) for text in texts)
+    for i, result in enumerate(results):
+        full_text = result.get("text") or ""
+        extra = len(full_text) - len(texts[i])
+        if full_text and extra <= remaining:
+            texts[i] = full_text
+            remaining -= extra
+
+    formatted_results = [
+        {'reference': result.get('reference', 'N/A'), 'text': text}
+        for result, text in zip(results, texts)
+    ]
+    used = estimate_tokens("".join((item['reference'] or "") + item['text'] for item in formatted_results)) \
+        + len(formatted_results) * ENTRY_OVERHEAD // CHARS_PER_TOKEN
+    logger.info(f"Formatted {len(results)} results into ~{used} tokens (budget {max_tokens})")
+    return formatted_results
@@ -1,7 +1,90 @@
-import requests, json
+import requests, json, threading, time, os, argparse, asyncio
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from cache import LRUCache, PersistentCache
+from text_store import TextStore
+from references import canonical_reference
 
 SEFARIA_API_BASE_URL = "http://localhost:8000"
 
+# Where texts and commentary links come from: "http" (the API), "local" (the offline text store
+# built by text_store.py) or "local+http" (the store, and the API for references it lacks)
+SEFARIA_BACKEND = os.getenv("SEFARIA_BACKEND", "http")
+TEXT_STORE_PATH = os.getenv("TEXT_STORE_PATH", "text_store")
+
+# (connect, read) timeouts in seconds, so a hung backend cannot block an agent turn
+TIMEOUT = (3.05, 20)
+# Idempotent GETs are retried on connection errors and these statuses, with exponential backoff
+MAX_RETRIES = 3
+BACKOFF_FACTOR = 0.3
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# Connections kept alive to the API, enough for the agent sessions running at once
+POOL_SIZE = 16
+# Requests a single AsyncSefariaClient has in flight at once
+MAX_CONCURRENCY = 8
+
+DAY = 24 * 60 * 60
+# Responses are cached on disk at this path (empty to keep them in memory only)
+CACHE_PATH = os.getenv("SEFARIA_CACHE_PATH", "sefaria_cache.sqlite3")
+# (fresh, stale) seconds per endpoint: fresh responses are served from the cache; stale ones
+# are served too while they are refreshed in the background; older ones are fetched again
+CACHE_TTLS = {
+    "api/v3/texts/": (30 * DAY, 365 * DAY),
+    "api/related/": (7 * DAY, 90 * DAY),
+    "api/calendars": (DAY, DAY // 24),
+}
+
+_session = None
+_session_lock = threading.Lock()
+_memory_cache = LRUCache(1024, max_bytes=32 * 1024 * 1024)
+_disk_cache = None
+_cache_lock = threading.Lock()
+_cache_counts = {"memory_hits": 0, "disk_hits": 0, "stale_hits": 0, "misses": 0}
+_refreshing = set()
+_text_store = None
+
+
+def create_session(pool_size: int = POOL_SIZE, max_retries: int = MAX_RETRIES,
+                   backoff_factor: float = BACKOFF_FACTOR) -> requests.Session:
+    """
+    Creates a session reusing keep-alive connections, retrying failed GETs.
+    """
+    retry = Retry(total=max_retries, backoff_factor=backoff_factor, status_forcelist=RETRY_STATUSES,
+                  allowed_methods=frozenset({"GET"}), raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def get_session() -> requests.Session:
+    """
+    Returns the session shared by all requests to the Sefaria API.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = create_session()
+    return _session
+
+
+def configure(timeout=None, pool_size: int = POOL_SIZE, max_retries: int = MAX_RETRIES,
+              backoff_factor: float = BACKOFF_FACTOR):
+    """
+    Replaces the shared session, and the (connect, read) timeouts if given.
+    """
+    global _session, TIMEOUT
+    if timeout is not None:
+        TIMEOUT = timeout
+    with _session_lock:
+        old_session, _session = _session, create_session(pool_size, max_retries, backoff_factor)
+    if old_session is not None:
+        old_session.close()
+
+
 def _get_request_json_data(endpoint, ref=None, param=None):
     """
     Helper function to make GET requests to the Sefaria API and parse the JSON response.
@@ -15,7 +98,7 @@ def _get_request_json_data(endpoint, ref=None, param=None):
         url += f"?{param}"
 
     try:
-        response = requests.get(url)
+        response = get_session().get(url, timeout=TIMEOUT)
         response.raise_for_status()  # Raise an exception for bad status codes
         data = response.json()
         return data
@@ -24,10 +107,137 @@ def _get_request_json_data(endpoint, ref=None, param=None):
         return None
     
 
+def _get_disk_cache():
+    global _disk_cache
+    if _disk_cache is None and CACHE_PATH:
+        with _cache_lock:
+            if _disk_cache is None:
+                _disk_cache = PersistentCache(CACHE_PATH)
+    return _disk_cache
+
+
+def _count(name):
+    with _cache_lock:
+        _cache_counts[name] += 1
+
+
+def _cache_key(endpoint, ref=None, param=None):
+    return f"{endpoint}{ref or ''}" + (f"?{param}" if param else "")
+
+
+def _fetch_and_cache(key, endpoint, ref=None, param=None):
+    data = _get_request_json_data(endpoint, ref, param)
+    if data is not None:
+        fetched_at = time.time()
+        _memory_cache.put(key, (data, fetched_at))
+        disk_cache = _get_disk_cache()
+        if disk_cache is not None:
+            disk_cache.put(key, data, fetched_at)
+    return data
+
+
+def _refresh_in_background(key, endpoint, ref=None, param=None):
+    with _cache_lock:
+        if key in _refreshing:
+            return
+        _refreshing.add(key)
+
+    def refresh():
+        try:
+            _fetch_and_cache(key, endpoint, ref, param)
+        finally:
+            with _cache_lock:
+                _refreshing.discard(key)
+
+    threading.Thread(target=refresh, name="sefaria-refresh", daemon=True).start()
+
+
+def _get_cached_json_data(endpoint, ref=None, param=None):
+    """
+    Returns the response of a GET request from the memory or disk cache, fetching it when missing or too old.
+    """
+    key = _cache_key(endpoint, ref, param)
+    fresh_ttl, stale_ttl = CACHE_TTLS.get(endpoint, (0, 0))
+    entry = _memory_cache.get(key)
+    tier = "memory_hits"
+    if entry is None and _get_disk_cache() is not None:
+        entry = _get_disk_cache().get(key)
+        tier = "disk_hits"
+        if entry is not None:
+            _memory_cache.put(key, entry)
+
+    if entry is not None:
+        data, fetched_at = entry
+        age = time.time() - fetched_at
+        if age <= fresh_ttl:
+            _count(tier)
+            return data
+        if age <= fresh_ttl + stale_ttl:
+            _count("stale_hits")
+            _refresh_in_background(key, endpoint, ref, param)
+            return data
+
+    _count("misses")
+    data = _fetch_and_cache(key, endpoint, ref, param)
+    if data is None and entry is not None:
+        # The API is unreachable, an outdated response beats none
+        return entry[0]
+    return data
+
+
+def cache_stats():
+    """
+    Returns the hit counters of the response cache and the size of its disk tier.
+    """
+    with _cache_lock:
+        stats = dict(_cache_counts)
+    lookups = sum(stats.values())
+    stats["hit_ratio"] = (lookups - stats["misses"]) / lookups if lookups else 0.0
+    stats["memory"] = _memory_cache.stats()
+    disk_cache = _get_disk_cache()
+    stats["disk"] = disk_cache.stats() if disk_cache is not None else None
+    return stats
+
+
+def prefetch(references, workers: int = 8) -> int:
+    """
+    Fills the cache with the texts and commentaries of the given references, e.g. before going offline.
+
+    Returns the number of references whose text could be fetched.
+    """
+    def fetch(reference):
+        reference = canonical_reference(reference)
+        text = _get_cached_json_data("api/v3/texts/", reference)
+        _get_cached_json_data("api/related/", reference)
+        return text is not None
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return sum(executor.map(fetch, references))
+
+
+def _get_text_store():
+    """
+    Returns the offline text store when the backend uses it, else None.
+    """
+    global _text_store
+    if _text_store is None and SEFARIA_BACKEND in ("local", "local+http"):
+        with _cache_lock:
+            if _text_store is None:
+                _text_store = TextStore(TEXT_STORE_PATH)
+    return _text_store
+
+
 def get_text(reference: str) -> str:
     """
     Retrieves the text for a given reference.
     """
+    # Equivalent references share cache entries, and Sefaria gets a form it parses
+    reference = canonical_reference(reference)
+    text_store = _get_text_store()
+    if text_store is not None:
+        text = text_store.get_text(reference)
+        if text is not None or SEFARIA_BACKEND == "local":
+            return str(text)
     return str(_get_hebrew_text(reference))
 
 
@@ -35,7 +245,7 @@ def get_weekly_parasha():
     """
     Retrieves the weekly Parasha data using the Calendars API.
     """
-    data = _get_request_json_data("api/calendars")
+    data = _get_cached_json_data("api/calendars")
 
     if data:
         calendar_items = data.get('calendar_items', [])
@@ -58,7 +268,7 @@ def _get_hebrew_text(parasha_ref):
     """
     Retrieves the Hebrew text and version title for the given verse.
     """
-    data = _get_request_json_data("api/v3/texts/", parasha_ref)
+    data = _get_cached_json_data("api/v3/texts/", parasha_ref)
 
     if data and "versions" in data and len(data['versions']) > 0:
         he_pasuk = data['versions'][0]['text']
@@ -72,7 +282,14 @@ def get_commentaries(parasha_ref)-> list[str]:
     """
     Retrieves and filters commentaries on the given verse.
     """
-    data = _get_request_json_data("api/related/", parasha_ref)
+    parasha_ref = canonical_reference(parasha_ref)
+    text_store = _get_text_store()
+    if text_store is not None:
+        commentaries = text_store.get_commentaries(parasha_ref)
+        if commentaries or SEFARIA_BACKEND == "local":
+            return commentaries
+
+    data = _get_cached_json_data("api/related/", parasha_ref)
 
     commentaries = []
     if data and "links" in data:
@@ -81,3 +298,65 @@ def get_commentaries(parasha_ref)-> list[str]:
                 commentaries.append(linked_text.get('sourceHeRef'))
 
     return commentaries
+
+
+class AsyncSefariaClient:
+    """
+    asyncio interface to the Sefaria API for fetching many texts at once.
+
+    Requests run in worker threads on the shared pooled session, so they use the
+    same response cache, timeouts and retries as the functions above; at most
+    max_concurrency of them are in flight at a time.
+    """
+
+    def __init__(self, max_concurrency: int = MAX_CONCURRENCY):
+        self.max_concurrency = max_concurrency
+
+    async def _call(self, semaphore, function, *args):
+        async with semaphore:
+            return await asyncio.to_thread(function, *args)
+
+    async def get_text(self, reference: str) -> str:
+        return await asyncio.to_thread(get_text, reference)
+
+    async def get_commentaries(self, reference: str) -> list[str]:
+        return await asyncio.to_thread(get_commentaries, reference)
+
+    async def get_texts(self, references: list[str]) -> dict[str, str]:
+        """
+        Retrieves the texts of several references concurrently, keyed by reference in the given order.
+        """
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        texts = await asyncio.gather(*(self._call(semaphore, get_text, reference) for reference in references))
+        return dict(zip(references, texts))
+
+    async def get_with_commentaries(self, reference: str, max_commentaries: int = None) -> dict:
+        """
+        Retrieves the text of a verse and the texts of its first max_commentaries (all by default) commentaries.
+
+        The verse text and the commentary list are requested together, then all commentary texts at once.
+        """
+        text, commentaries = await asyncio.gather(self.get_text(reference), self.get_commentaries(reference))
+        commentaries = list(dict.fromkeys(commentary for commentary in commentaries if commentary))[:max_commentaries]
+        return {
+            "reference": reference,
+            "text": text,
+            "commentaries": await self.get_texts(commentaries),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-populate the Sefaria response cache")
+    parser.add_argument("references", help="file with one reference per line")
+    parser.add_argument("--workers", type=int, default=8, help="concurrent requests")
+    args = parser.parse_args()
+
+    with open(args.references, encoding="utf-8") as f:
+        references = [line.strip() for line in f if line.strip()]
+    fetched = prefetch(references, args.workers)
+    print(f"Cached {fetched} of {len(references)} references")
+    print(json.dumps(cache_stats(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
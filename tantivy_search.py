@@ -1,21 +1,465 @@
-from typing import List, Dict, Any, Optional
-from tantivy import Index
+from typing import List, Dict, Any, Iterator, Optional, Sequence
+from tantivy import Index, Query, SnippetGenerator
+from concurrent.futures import ThreadPoolExecutor
+from cache import LRUCache
+from hebrew import (NORMALIZED_TEXT_FIELD, normalize_hebrew, prefix_stems, prefix_variants, register_hebrew_analyzer,
+                    restore_final_letter, rewrite_query)
+from highlighter import Highlighter, query_terms
+from references import canonical_reference
+from metrics import NULL_TRACE, SIZE_BUCKETS, MetricsRegistry, SearchTrace
+import heapq
+import itertools
+import json
 import logging
+import math
 import os
 import re
+import threading
+import time
+
+
+RELOAD_POLICIES = ("manual", "on_commit", "periodic")
+# Representative queries run at warm-up to load postings, term dictionaries and stored blocks
+DEFAULT_WARMUP_QUERIES = ("שבת", "אמר רבי", "תורה", "הלכה", "topics:תנך", "reference:בראשית")
+SNIPPET_MODES = ("regex", "native")
+# Hits ranked per shard before re-scoring with statistics of all shards, per result wanted
+RESCORE_OVERFETCH = 2
+# tantivy limits snippets in UTF-8 bytes; Hebrew letters and vowel points take two each
+HEBREW_BYTES_PER_CHAR = 2
+# How a query string was turned into a query, see TantivySearch._parse_query
+PARSE_PATHS = ("lenient", "escaped", "empty")
+_EMPTY_QUERY = repr(Query.empty_query())
+_FIELD_PREFIX = re.compile(r"\b[A-Za-z_]\w*:")
+_QUERY_SYNTAX = re.compile(r'["()\[\]{}^~+!*?\\]|(?<!\w)-')
+_BOOLEAN_SYNTAX = re.compile(r'["\'()]|\b(AND|OR|NOT)\b')
+_SCOPED_TERM = re.compile(r'(?<![\w:])(?P<excluded>-|\bNOT\s+)?\+?(?P<field>[A-Za-z_]\w*):'
+                          r'(?P<value>"[^"]*"|\([^)]*\)|[^\s()"]+)')
+_BOOST = re.compile(r"[\^~][\d.]*$")
+_TERM_CONTEXT = re.compile(r'Term\(field=(\d+), type=Str, "(.*)"\)')
+slow_query_logger = logging.getLogger(f"{__name__}.slow")
+# Result keys and how to compute each of them from a stored document and its score
+RESULT_FIELDS = {
+    "score": lambda doc, score: float(score),
+    "title": lambda doc, score: doc.get_first("title") or os.path.basename(doc.get_first("filePath") or ""),
+    "reference": lambda doc, score: doc.get_first("reference"),
+    "topics": lambda doc, score: " ".join(doc.get_all("topics")) or None,
+    "file_path": lambda doc, score: doc.get_first("filePath"),
+    "line_number": lambda doc, score: doc.get_first("segment"),
+    "is_pdf": lambda doc, score: doc.get_first("isPdf"),
+    "text": lambda doc, score: doc.get_first("text"),
+}
+
+
+def reference_prefix(reference: Optional[str]) -> str:
+    """Return a reference without its last part, e.g. the chapter of a verse"""
+    if not reference:
+        return ""
+    reference = reference.strip()
+    for separator in (",", ":", " "):
+        if separator in reference:
+            return reference.rsplit(separator, 1)[0].strip()
+    return reference
+
+
+# How to compute the group of a stored document when collapsing results
+COLLAPSE_KEYS = {
+    "file_path": lambda doc: doc.get_first("filePath"),
+    "reference": lambda doc: reference_prefix(doc.get_first("reference")),
+}
+
+
+def quote_term(value: str) -> str:
+    """Quote a value as a phrase for the tantivy query parser"""
+    return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def edit_distance(a: str, b: str, max_distance: int) -> int:
+    """Return the Levenshtein distance of a and b, or max_distance + 1 once it is known to exceed it"""
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous = current
+    return min(previous[-1], max_distance + 1)
+
+
+def scoped_query_terms(query: str) -> List[tuple]:
+    """Return the (field, value) pairs of the plain search terms of a query.
+
+    Terms of a field:term clause keep their field, with a quoted phrase as
+    one value, and the other terms come from query_terms() with field None.
+    Excluded clauses and wildcard values are left out.
+    """
+    scoped = []
+
+    def collect(match) -> str:
+        field, value = match.group("field", "value")
+        if match.group("excluded"):
+            return " "
+        if value.startswith("("):
+            scoped.extend((field, term) for term in query_terms(value))
+        elif value.startswith('"'):
+            scoped.append((field, value.strip('"')))
+        elif "*" not in value and "?" not in value:
+            scoped.append((field, _BOOST.sub("", value)))
+        return " "
+
+    unscoped = _SCOPED_TERM.sub(collect, query)
+    return [(field, value) for field, value in scoped if value] + [(None, term) for term in query_terms(unscoped)]
+
+
+def likely_empty(query: str, terms: List[Dict[str, Any]]) -> bool:
+    """Tell from the checked terms of a query whether it will match nothing.
+
+    True when no term exists, or when a term is missing and the query
+    requires all of them (phrases, AND, +).
+    """
+    missing = [entry for entry in terms if not entry["doc_freq"]]
+    requires_all = bool(re.search(r'["+]|\bAND\b', query))
+    return bool(missing) and (len(missing) == len(terms) or requires_all)
+
+
+def register_search_metrics(metrics: MetricsRegistry):
+    """Set the histogram buckets of the size metrics reported by record_search"""
+    metrics.set_buckets("search_hits", SIZE_BUCKETS)
+    metrics.set_buckets("search_result_chars", SIZE_BUCKETS)
+
+
+def record_search(metrics: Optional[MetricsRegistry], slow_query_seconds: Optional[float], query: str,
+                  trace: SearchTrace, results: List[Dict[str, Any]], hits: int = 0, cached: bool = False):
+    """Report the phase timings and sizes of a finished search to the metrics and slow query log"""
+    elapsed = trace.elapsed()
+    if metrics is not None:
+        metrics.inc("search_requests_total", cached=str(cached).lower())
+        metrics.observe("search_seconds", elapsed, cached=str(cached).lower())
+        for phase, seconds in trace.phases.items():
+            metrics.observe("search_phase_seconds", seconds, phase=phase)
+        if not cached:
+            metrics.observe("search_hits", hits)
+            metrics.observe("search_result_chars", sum(
+                len(value) for result in results for value in result.values() if isinstance(value, str)
+            ) + sum(len(snippet) for result in results for snippet in result.get("highlights", ())))
+            if not results:
+                metrics.inc("search_empty_total")
+    if slow_query_seconds is not None and elapsed >= slow_query_seconds:
+        details = [f"{len(results)} results"] + (["cached"] if cached else []) + [
+            f"{phase}={seconds * 1000:.1f}ms" for phase, seconds in trace.phases.items()
+        ]
+        slow_query_logger.warning(f"Slow query ({elapsed * 1000:.1f}ms; {', '.join(details)}): {query}")
+
+
+def normalize_query(query: str) -> str:
+    """Return a canonical form of a query for use as a cache key.
+
+    Whitespace is collapsed, and for flat queries (no phrases, grouping or
+    boolean keywords) the clauses are sorted, since their order does not
+    affect the result set or the scores.
+    """
+    terms = query.split()
+    if not _BOOLEAN_SYNTAX.search(query):
+        terms.sort()
+    return " ".join(terms)
 
 
 class TantivySearch:
-    def __init__(self, index_path: str):
-        """Initialize the Tantivy search agent with the index path"""
+    def __init__(self, index_path: str, reload_policy: str = "on_commit", reload_interval: float = 60.0,
+                 cache_size: int = 256, cache_max_bytes: Optional[int] = 64 * 1024 * 1024,
+                 cache_ttl: Optional[float] = 600.0, max_workers: int = 4,
+                 build_reference_map: bool = False, warmup: bool = False,
+                 warmup_queries: Sequence[str] = DEFAULT_WARMUP_QUERIES, warmup_in_background: bool = True,
+                 metrics: Optional[MetricsRegistry] = None, slow_query_seconds: Optional[float] = None,
+                 query_cache_size: int = 1024):
+        """Initialize the Tantivy search agent with the index path.
+
+        reload_policy controls when the shared searcher is refreshed:
+        "manual" only on reload(), "on_commit" whenever the index generation
+        changes, and "periodic" at most once every reload_interval seconds.
+        Search results are kept in an LRU cache bounded by cache_size entries,
+        cache_max_bytes and cache_ttl seconds; a cache_size of 0 disables it.
+        Parsed queries are cached separately, up to query_cache_size of them.
+        max_workers sets the size of the thread pool used by search_many.
+        build_reference_map precomputes a reference -> document address map
+        for exact reference lookups, in a background thread whenever the
+        searcher is refreshed; lookups use a phrase query until it is ready.
+        warmup reads the index files ahead into the page cache and runs
+        warmup_queries once the index is open, in a background thread if
+        warmup_in_background is set; is_ready() tells when it is done.
+        metrics receives the time spent in each phase of search() (parse,
+        search, fetch, highlight), hit counts and result sizes, and searches
+        slower than slow_query_seconds are logged with their phases to the
+        tantivy_search.slow logger. With neither set, searches are not timed.
+        """
+        if reload_policy not in RELOAD_POLICIES:
+            raise ValueError(f"Unknown reload policy: {reload_policy}")
         self.index_path = index_path
+        self.reload_policy = reload_policy
+        self.reload_interval = reload_interval
         self.logger = logging.getLogger(__name__)
+        self._searcher_lock = threading.Lock()
+        self._searcher = None
+        self._last_reload_check = 0.0
+        self._meta_mtime = None
+        self.generation = None
+        # (searcher, generation) swapped together, so a searcher's generation can be told apart from the current one
+        self._snapshot = (None, None)
+        self.result_cache = LRUCache(cache_size, cache_max_bytes, cache_ttl)
+        self.query_cache = LRUCache(query_cache_size)
+        self.parse_paths: Dict[str, int] = dict.fromkeys(PARSE_PATHS, 0)
+        self._stats_lock = threading.Lock()
+        self.max_workers = max_workers
+        self._executor = None
+        self._facet_methods: Dict[str, str] = {}
+        self.build_reference_map = build_reference_map
+        # (searcher, map) so lookups never mix addresses of different snapshots
+        self._reference_map: Optional[tuple] = None
+        self._reference_map_lock = threading.Lock()
+        self._reference_map_wanted = False
+        self._reference_map_building = False
+        self._ready = threading.Event()
+        self.warmup_seconds: Optional[float] = None
+        self.metrics = metrics
+        self.slow_query_seconds = slow_query_seconds
+        if metrics is not None:
+            register_search_metrics(metrics)
         try:
             self.index = Index.open(index_path)
+            # Custom analyzers are not persisted with the index
+            register_hebrew_analyzer(self.index)
+            self.normalized_field = self._schema_field(NORMALIZED_TEXT_FIELD)
+            # Field ids, as they appear in score explanations, are positions in the schema
+            self._field_names = [field.get("name") for field in self._read_meta().get("schema", [])]
+            # We refresh the searcher ourselves, so tantivy's reader is kept manual
+            self.index.config_reader(reload_policy="Manual")
+            self._refresh_searcher()
             self.logger.info(f"Successfully opened Tantivy index at {index_path}")
         except Exception as e:
             self.logger.error(f"Failed to open Tantivy index: {e}")
             raise
+        if not warmup:
+            self._ready.set()
+        elif warmup_in_background:
+            threading.Thread(target=self.warmup, args=(warmup_queries,), name="tantivy-warmup",
+                             daemon=True).start()
+        else:
+            self.warmup(warmup_queries)
+
+    def warmup(self, queries: Sequence[str] = DEFAULT_WARMUP_QUERIES):
+        """Bring the index into the page cache and run representative queries.
+
+        Segment files are read ahead sequentially (posix_fadvise WILLNEED
+        where the platform has it, a plain read otherwise), then each query
+        is searched and its top documents loaded. Sets the readiness flag and
+        warmup_seconds when done, even if a step fails.
+        """
+        start = time.monotonic()
+        try:
+            self._read_ahead()
+            searcher = self.get_searcher()
+            for query in queries:
+                for _, doc_address in searcher.search(self._parse_query(query, searcher), 10, count=False).hits:
+                    searcher.doc(doc_address)
+        except Exception as e:
+            self.logger.warning(f"Index warm-up failed: {e}")
+        finally:
+            self.warmup_seconds = time.monotonic() - start
+            self._ready.set()
+            self.logger.info(f"Index warm-up finished in {self.warmup_seconds:.1f}s")
+
+    def _read_ahead(self):
+        """Ask the OS to load every index file into the page cache"""
+        for name in os.listdir(self.index_path):
+            path = os.path.join(self.index_path, name)
+            if not os.path.isfile(path) or name.startswith("."):
+                continue
+            with open(path, "rb") as f:
+                if hasattr(os, "posix_fadvise"):
+                    os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_WILLNEED)
+                else:
+                    while f.read(16 * 1024 * 1024):
+                        pass
+
+    def is_ready(self) -> bool:
+        """Return whether the index is open and warmed up"""
+        return self._ready.is_set()
+
+    def wait_until_ready(self, timeout: Optional[float] = None) -> bool:
+        """Block until warm-up finished or timeout seconds passed; return readiness"""
+        return self._ready.wait(timeout)
+
+    def _read_meta(self) -> Dict[str, Any]:
+        """Return the contents of the index meta file"""
+        try:
+            with open(os.path.join(self.index_path, "meta.json"), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"Could not read index meta file: {e}")
+            return {}
+
+    def _read_generation(self) -> Optional[int]:
+        """Return the opstamp of the last commit recorded in the index meta file"""
+        return self._read_meta().get("opstamp")
+
+    def _schema_field(self, name: str) -> Optional[str]:
+        """Return name if the index schema has a field of that name, None otherwise"""
+        fields = {field.get("name") for field in self._read_meta().get("schema", [])}
+        return name if name in fields else None
+
+    def _field_options(self, name: str) -> Dict[str, Any]:
+        """Return the schema options of a field, empty if the index has no such field"""
+        for field in self._read_meta().get("schema", []):
+            if field.get("name") == name:
+                return field.get("options") or {}
+        return {}
+
+    def _parse_query(self, query: str, searcher):
+        """Parse a query, normalizing Hebrew terms if the index has a normalized text field.
+
+        Tries in turn a lenient parse of the query, a parse of its words
+        quoted as plain terms (when the lenient parse fails or drops the
+        whole query, e.g. on an unknown field name) and finally the empty
+        query. Parsed queries are cached by query string, and the path taken
+        is counted in parse_paths and the metrics.
+        """
+        cached = self.query_cache.get(query)
+        if cached is not None:
+            parsed_query, path = cached
+        else:
+            parsed_query, path = self._parse_with_fallback(query, searcher)
+            self.query_cache.put(query, (parsed_query, path))
+        with self._stats_lock:
+            self.parse_paths[path] += 1
+        if self.metrics is not None:
+            self.metrics.inc("query_parse_total", path=path, cached=str(cached is not None).lower())
+        return parsed_query
+
+    def _parse_with_fallback(self, query: str, searcher) -> tuple:
+        """Return (parsed query, path) following the fallback chain of _parse_query"""
+        def rewrite(text: str) -> str:
+            if not self.normalized_field:
+                return text
+            return rewrite_query(text, term_exists=lambda field, term: searcher.doc_freq(field, term) > 0)
+
+        errors = []
+        try:
+            parsed_query, errors = self.index.parse_query_lenient(rewrite(query))
+            if not errors or repr(parsed_query) != _EMPTY_QUERY:
+                return parsed_query, "lenient"
+        except Exception as e:
+            errors = [e]
+        # Field names and query syntax are dropped, the remaining words searched as plain terms
+        words = _QUERY_SYNTAX.sub(" ", _FIELD_PREFIX.sub(" ", query)).split()
+        if words:
+            try:
+                parsed_query = self.index.parse_query(rewrite(" ".join(quote_term(word) for word in words)))
+                self.logger.warning(f"Searching the words of query {query!r} as plain terms: {errors}")
+                return parsed_query, "escaped"
+            except Exception as e:
+                errors.append(e)
+        self.logger.warning(f"Could not parse query {query!r}, no results: {errors}")
+        return Query.empty_query(), "empty"
+
+    def _meta_changed(self) -> bool:
+        """Cheaply check whether the index meta file was rewritten by a commit"""
+        try:
+            return os.stat(os.path.join(self.index_path, "meta.json")).st_mtime_ns != self._meta_mtime
+        except OSError:
+            return False
+
+    def _refresh_searcher(self):
+        """Reload the index reader and swap in a fresh shared searcher"""
+        try:
+            self._meta_mtime = os.stat(os.path.join(self.index_path, "meta.json")).st_mtime_ns
+        except OSError:
+            self._meta_mtime = None
+        generation = self._read_generation()
+        self.index.reload()
+        searcher = self.index.searcher()
+        self._searcher = searcher
+        self._snapshot = (searcher, generation)
+        if self.build_reference_map:
+            self._schedule_reference_map()
+        if generation != self.generation:
+            self.logger.info(f"Index generation changed: {self.generation} -> {generation}")
+            self.result_cache.clear()
+            # Rewritten queries depend on the terms present in the index
+            self.query_cache.clear()
+        self.generation = generation
+        self._last_reload_check = time.monotonic()
+
+    def _schedule_reference_map(self):
+        """Build the reference map of the shared searcher in a background thread"""
+        with self._reference_map_lock:
+            self._reference_map_wanted = True
+            if self._reference_map_building:
+                return
+            self._reference_map_building = True
+        threading.Thread(target=self._build_reference_maps, name="tantivy-reference-map", daemon=True).start()
+
+    def _build_reference_maps(self):
+        """Map the shared searcher, again as long as it was refreshed during the previous build"""
+        while True:
+            with self._reference_map_lock:
+                if not self._reference_map_wanted:
+                    self._reference_map_building = False
+                    return
+                self._reference_map_wanted = False
+            searcher = self._searcher
+            try:
+                self._reference_map = (searcher, self._load_reference_map(searcher))
+            except Exception as e:
+                self.logger.warning(f"Could not build the reference map: {e}")
+
+    def _load_reference_map(self, searcher) -> Dict[str, Any]:
+        """Map every reference in the index to the address of its first document"""
+        start = time.monotonic()
+        reference_map = {}
+        hits = searcher.search(Query.all_query(), max(searcher.num_docs, 1), count=False).hits
+        for _, doc_address in hits:
+            reference = searcher.doc(doc_address).get_first("reference")
+            if reference and reference not in reference_map:
+                reference_map[reference] = doc_address
+        self.logger.info(f"Mapped {len(reference_map)} references in {time.monotonic() - start:.1f}s")
+        return reference_map
+
+    def _cache_generation(self, searcher) -> tuple:
+        """Return (generation, cacheable) for results computed with searcher.
+
+        Results are cached under the generation of the shared searcher, so a
+        search finishing after a reload cannot store its results where the
+        new generation looks them up. Searchers older than the shared one are
+        not cached at all.
+        """
+        shared_searcher, generation = self._snapshot
+        return generation, searcher is shared_searcher
+
+    def reload(self):
+        """Refresh the shared searcher so it reflects the last commit to the index"""
+        with self._searcher_lock:
+            self._refresh_searcher()
+
+    def get_searcher(self):
+        """Return the shared searcher, refreshing it according to the reload policy.
+
+        The same searcher is handed out to all threads until the index
+        generation changes, so consecutive searches see a consistent snapshot.
+        """
+        if self.reload_policy == "manual":
+            return self._searcher
+        now = time.monotonic()
+        if self.reload_policy == "periodic" and now - self._last_reload_check < self.reload_interval:
+            return self._searcher
+        self._last_reload_check = now
+        if not self._meta_changed():
+            return self._searcher
+        with self._searcher_lock:
+            if self._meta_changed():
+                self._refresh_searcher()
+            return self._searcher
 
     def get_query_instructions(self) -> str:
         """Return instructions for the LLM on how to parse and construct Tantivy queries"""
@@ -79,87 +523,748 @@ Tips:
 - use field-specific terms for better results. 
 """
 
-    def search(self, query: str, num_results: int = 10) -> List[Dict[str, Any]]:
-        """Search the Tantivy index with the given query using Tantivy's query syntax"""
+    def search(self, query: str, num_results: int = 10, fields: Optional[Sequence[str]] = None,
+               highlights: bool = True, snippet_mode: str = "regex",
+               snippet_length: int = 200, collapse: Optional[str] = None, collapse_size: int = 1,
+               searcher=None, statistics: Optional["IndexStatistics"] = None) -> List[Dict[str, Any]]:
+        """Search the Tantivy index with the given query using Tantivy's query syntax.
+
+        fields restricts each result to the given keys of RESULT_FIELDS (all
+        of them by default), and highlights=False skips building snippets.
+        The stored document is only loaded when a requested key needs it.
+
+        snippet_mode "regex" matches the query terms against the text, while
+        "native" uses tantivy's snippet generator, which works from the
+        indexed term positions and returns the single best-scoring fragment
+        of at most snippet_length characters. tantivy measures fragments in
+        UTF-8 bytes, so it is given a budget sized for Hebrew text and the
+        fragment is cut back to snippet_length characters at a word boundary.
+        On indexes with the normalized Hebrew field, whose terms tantivy
+        cannot map back to the stored text, the single fragment comes from the
+        regex highlighter instead.
+
+        collapse groups hits by "file_path" or by "reference" prefix (the book
+        and chapter, without the last part of the citation) and keeps only the
+        best collapse_size hits of each group, fetching further hits as needed
+        to still return num_results of them.
+
+        searcher may be a searcher obtained from get_searcher(), so that
+        several searches run against the same snapshot of the index.
+
+        statistics, given when this index is a shard, makes scores use the
+        document counts of all shards; see rescore().
+        """
+        if collapse is not None and collapse not in COLLAPSE_KEYS:
+            raise ValueError(f"Unknown collapse key: {collapse}")
+        fields = self._check_result_options(fields, snippet_mode)
+        trace = SearchTrace() if self.metrics is not None or self.slow_query_seconds is not None else NULL_TRACE
         try:
-            # Create a searcher
-            searcher = self.index.searcher()
-     
+            if searcher is None:
+                searcher = self.get_searcher()
+            generation, cacheable = self._cache_generation(searcher)
+            cache_key = (generation, normalize_query(query), num_results, tuple(fields), highlights, snippet_mode,
+                         snippet_length, collapse, collapse_size, statistics.key if statistics else None)
+            cached = self.result_cache.get(cache_key) if cacheable else None
+            if cached is not None:
+                results = [dict(result) for result in cached]
+                if trace.enabled:
+                    record_search(self.metrics, self.slow_query_seconds, query, trace, results, cached=True)
+                return results
+
             # Parse and execute the query
-            try:
-                # First try with lenient parsing
-                query_parser = self.index.parse_query_lenient(query)
-                search_results = searcher.search(query_parser[0], num_results).hits
-                
-            except Exception as query_error:
-                self.logger.error(f"Lenient query parsing failed: {query_error}")
-            
+            with trace.span("parse"):
+                parsed_query = self._parse_query(query, searcher)
+            if collapse:
+                search_results = self._collapsed_hits(searcher, parsed_query, num_results,
+                                                      collapse, collapse_size, trace=trace)
+            else:
+                limit = num_results * RESCORE_OVERFETCH if statistics else num_results
+                with trace.span("search"):
+                    search_results = [(score, doc_address, None) for score, doc_address
+                                      in searcher.search(parsed_query, limit).hits]
+            if statistics:
+                with trace.span("rescore"):
+                    search_results = self.rescore(searcher, parsed_query, search_results, statistics)[:num_results]
+
             # Process results
-            results = []
-            for score, doc_address in search_results:
-                doc = searcher.doc(doc_address)
-                text = doc.get_first("text")
-                
-                # Extract highlighted snippets based on query terms
-                # Remove special syntax for highlighting while preserving Hebrew
-                highlight_terms = re.sub(
-                    r'[:"()[\]{}^~*\\]|\b(AND|OR|NOT|TO|IN)\b|[-+]', 
-                    ' ', 
-                    query
-                ).strip()
-                highlight_terms = [term for term in highlight_terms.split() if len(term) > 1]
-                
-                # Create regex pattern for highlighting
-                if highlight_terms:
-                    # Escape regex special chars but preserve Hebrew
-                    patterns = [re.escape(term) for term in highlight_terms]
-                    pattern = '|'.join(patterns)
-                    # Get surrounding context for matches
-                    matches = list(re.finditer(pattern, text, re.IGNORECASE))
-                    if matches:
-                        highlights = []
-                        for match in matches:
-                            start = max(0, match.start() - 50)
-                            end = min(len(text), match.end() + 50)
-                            highlight = text[start:end]
-                            if start > 0:
-                                highlight = f"...{highlight}"
-                            if end < len(text):
-                                highlight = f"{highlight}..."
-                            highlights.append(highlight)
-                    else:
-                        highlights = [text[:100] + "..." if len(text) > 100 else text]
-                else:
-                    highlights = [text[:100] + "..." if len(text) > 100 else text]
-                
-                result = {
-                    "score": float(score),
-                    "title": doc.get_first("title") or os.path.basename(doc.get_first("filePath") or ""),
-                    "reference": doc.get_first("reference"),
-                    "topics": doc.get_first("topics"),
-                    "file_path": doc.get_first("filePath"),
-                    "line_number": doc.get_first("segment"),
-                    "is_pdf": doc.get_first("isPdf"),
-                    "text": text,
-                    "highlights": highlights
-                }
-                results.append(result)
+            build_result = self._result_builder(searcher, query, parsed_query, fields, highlights,
+                                                snippet_mode, snippet_length, trace)
+            results = [build_result(score, doc_address, doc) for score, doc_address, doc in search_results]
             
             self.logger.info(f"Found {len(results)} results for query: {query}")
+            if cacheable:
+                self.result_cache.put(cache_key, [dict(result) for result in results])
+            if trace.enabled:
+                record_search(self.metrics, self.slow_query_seconds, query, trace, results,
+                              hits=len(search_results))
             return results
             
         except Exception as e:
             self.logger.error(f"Error during search: {str(e)}")
             return []
 
+    def iter_search(self, query: str, page_size: int = 50, offset: int = 0,
+                    fields: Optional[Sequence[str]] = None, highlights: bool = True,
+                    snippet_mode: str = "regex", snippet_length: int = 200) -> Iterator[Dict[str, Any]]:
+        """Lazily yield the results of a query, fetching page_size hits at a time.
+
+        Results are built like those of search(), starting at offset. Only
+        the current page is held in memory and the stored documents of a page
+        are loaded as its results are consumed, so callers can stop at any
+        point. All pages come from the same snapshot of the index. Tantivy
+        still ranks offset + page_size hits for each page, but never loads
+        the documents of earlier pages.
+        """
+        fields = self._check_result_options(fields, snippet_mode)
+        searcher = self.get_searcher()
+        parsed_query = self._parse_query(query, searcher)
+        build_result = self._result_builder(searcher, query, parsed_query, fields, highlights,
+                                            snippet_mode, snippet_length)
+        for score, doc_address in self.iter_hits(searcher, parsed_query, page_size, offset):
+            yield build_result(score, doc_address, None)
+
+    def iter_hits(self, searcher, parsed_query, page_size: int = 50, offset: int = 0,
+                  statistics: Optional["IndexStatistics"] = None) -> Iterator[tuple]:
+        """Lazily yield the (score, doc_address) hits of a parsed query, page_size at a time.
+
+        With statistics, each page is re-scored (see rescore()) and yielded
+        best first, so the order across pages is only approximately by score.
+        """
+        while True:
+            hits = searcher.search(parsed_query, page_size, count=False, offset=offset).hits
+            yield from self.rescore(searcher, parsed_query, hits, statistics) if statistics else hits
+            if len(hits) < page_size:
+                return
+            offset += page_size
+
+    def rescore(self, searcher, query, hits: Sequence[tuple], statistics: "IndexStatistics") -> List[tuple]:
+        """Re-score hits with the document counts of statistics and return them best first.
+
+        hits are tuples starting with (score, doc_address). Each term's BM25
+        contribution, taken from tantivy's explanation of the score, is scaled
+        by the ratio of its idf over all shards to its idf in this index.
+        Terms inside phrases, which the explanation does not name, and field
+        lengths keep their local statistics.
+        """
+        rescored = []
+        for hit in hits:
+            explanation = json.loads(query.explain(searcher, hit[1]).to_json())
+            rescored.append((self._global_score(explanation, statistics), *hit[1:]))
+        rescored.sort(key=lambda hit: -hit[0])
+        return rescored
+
+    def _global_score(self, node: Dict[str, Any], statistics: "IndexStatistics") -> float:
+        """Return the value of an explanation node computed with global idfs"""
+        details = node.get("details") or []
+        idf = next((detail for detail in details if detail["description"].startswith("idf")), None)
+        if idf is not None:
+            term = _TERM_CONTEXT.search(" ".join(node.get("context") or []))
+            if term is None or not idf["value"]:
+                return node["value"]
+            field = self._field_names[int(term.group(1))]
+            num_docs, doc_freq = statistics.num_docs, statistics.doc_freq(field, term.group(2))
+            return node["value"] * math.log(1 + (num_docs - doc_freq + 0.5) / (doc_freq + 0.5)) / idf["value"]
+        old = sum(detail["value"] for detail in details)
+        if not old:
+            return node["value"]
+        # Sums scale with their clauses, and boosts with their single clause
+        return node["value"] * sum(self._global_score(detail, statistics) for detail in details) / old
+
+    def _check_result_options(self, fields: Optional[Sequence[str]], snippet_mode: str) -> List[str]:
+        """Validate the result options of a search and return the fields to build"""
+        if snippet_mode not in SNIPPET_MODES:
+            raise ValueError(f"Unknown snippet mode: {snippet_mode}")
+        if fields is None:
+            return list(RESULT_FIELDS)
+        unknown = [field for field in fields if field not in RESULT_FIELDS]
+        if unknown:
+            raise ValueError(f"Unknown result fields: {unknown}")
+        return list(fields)
+
+    def _result_builder(self, searcher, query: str, parsed_query, fields: Sequence[str], highlights: bool,
+                        snippet_mode: str, snippet_length: int, trace=NULL_TRACE):
+        """Return a function building a result dict from a hit and its (optional) stored document"""
+        needs_doc = highlights or any(field != "score" for field in fields)
+        highlight = None
+        if highlights and snippet_mode == "native" and self.normalized_field:
+            # Queries are rewritten to the normalized field, which tantivy cannot build snippets from
+            highlighter = Highlighter(query, context=snippet_length // 2, max_fragments=1,
+                                      max_fragment_length=snippet_length, fallback_length=snippet_length)
+            highlight = lambda doc: highlighter.highlight(doc.get_first("text"))
+        elif highlights and snippet_mode == "native":
+            highlight = self._native_highlighter(searcher, parsed_query, snippet_length)
+        elif highlights:
+            highlighter = Highlighter(query)
+            highlight = lambda doc: highlighter.highlight(doc.get_first("text"))
+
+        def build_result(score, doc_address, doc) -> Dict[str, Any]:
+            if doc is None and needs_doc:
+                with trace.span("fetch"):
+                    doc = searcher.doc(doc_address)
+            result = {field: RESULT_FIELDS[field](doc, score) for field in fields}
+            if highlight:
+                with trace.span("highlight"):
+                    result["highlights"] = highlight(doc)
+            return result
+
+        return build_result
+
+    def _collapsed_hits(self, searcher, query, num_results: int, collapse: str, collapse_size: int,
+                        overfetch: int = 4, max_scanned: int = 1000, trace=NULL_TRACE) -> List[tuple]:
+        """Collect the best hits keeping at most collapse_size per group.
+
+        Hits are fetched in pages of overfetch times num_results until enough
+        groups are filled, the results run out or max_scanned hits were read.
+        Returns (score, doc_address, doc) tuples.
+        """
+        group_key = COLLAPSE_KEYS[collapse]
+        page_size = max(num_results * overfetch, 20)
+        group_counts: Dict[Any, int] = {}
+        selected = []
+        offset = 0
+        while len(selected) < num_results and offset < max_scanned:
+            with trace.span("search"):
+                hits = searcher.search(query, page_size, count=False, offset=offset).hits
+            for score, doc_address in hits:
+                with trace.span("fetch"):
+                    doc = searcher.doc(doc_address)
+                key = group_key(doc)
+                if group_counts.get(key, 0) < collapse_size:
+                    group_counts[key] = group_counts.get(key, 0) + 1
+                    selected.append((score, doc_address, doc))
+                    if len(selected) == num_results:
+                        break
+            if len(hits) < page_size:
+                break
+            offset += page_size
+        return selected
+
+    def get_context(self, file_path: str, segment: int, before: int = 2, after: int = 2,
+                    fields: Sequence[str] = ("reference", "line_number", "text")) -> List[Dict[str, Any]]:
+        """Return the segments of a file around the given segment, in order.
+
+        Reads the range segment - before .. segment + after of file_path
+        straight from the index.
+        """
+        unknown = [field for field in fields if field not in RESULT_FIELDS]
+        if unknown:
+            raise ValueError(f"Unknown result fields: {unknown}")
+        first, last = max(0, segment - before), segment + after
+        try:
+            searcher = self.get_searcher()
+            query = self.index.parse_query(f"+filePath:{quote_term(file_path)} +segment:[{first} TO {last}]")
+            hits = searcher.search(query, (last - first + 1) * 2, count=False).hits
+            docs = [searcher.doc(doc_address) for _, doc_address in hits]
+            # A tokenized filePath may match other paths sharing the same words
+            docs = [doc for doc in docs if doc.get_first("filePath") == file_path]
+            docs.sort(key=lambda doc: doc.get_first("segment"))
+            return [{field: RESULT_FIELDS[field](doc, 0.0) for field in fields} for doc in docs]
+        except Exception as e:
+            self.logger.error(f"Error reading context of {file_path}:{segment}: {e}")
+            return []
+
+    def get_document(self, reference: str):
+        """Return the stored document with exactly this reference, or None.
+
+        Uses the precomputed reference map when it was built, and an exact
+        phrase lookup on the reference field otherwise. A reference not found
+        as given is also tried in its canonical Hebrew and English forms.
+        """
+        doc = self._get_document(reference)
+        if doc is None:
+            forms = (" ".join(reference.split()), canonical_reference(reference, hebrew=True),
+                     canonical_reference(reference))
+            for form in dict.fromkeys(forms):
+                if form != reference:
+                    doc = self._get_document(form)
+                    if doc is not None:
+                        break
+        return doc
+
+    def _get_document(self, reference: str):
+        try:
+            searcher = self.get_searcher()
+            mapped = self._reference_map
+            if mapped is not None and mapped[0] is searcher:
+                doc_address = mapped[1].get(reference)
+                return searcher.doc(doc_address) if doc_address is not None else None
+            query = self.index.parse_query(f"reference:{quote_term(reference)}")
+            for _, doc_address in searcher.search(query, 10, count=False).hits:
+                doc = searcher.doc(doc_address)
+                if doc.get_first("reference") == reference:
+                    return doc
+        except Exception as e:
+            self.logger.error(f"Error looking up reference {reference}: {e}")
+        return None
+
+    def locate(self, reference: str) -> Optional[tuple]:
+        """Return the (file_path, segment) of the document with exactly this reference"""
+        doc = self.get_document(reference)
+        if doc is None:
+            return None
+        return doc.get_first("filePath"), doc.get_first("segment")
+
+    def get_text(self, reference: str) -> Optional[str]:
+        """Return the text stored for exactly this reference, or None"""
+        doc = self.get_document(reference)
+        return doc.get_first("text") if doc is not None else None
+
+    def check_terms(self, query: str, field: Optional[str] = None, max_suggestions: int = 3,
+                    max_distance: int = 2, max_candidates: int = 5000) -> Dict[str, Any]:
+        """Check the terms of a query against the term dictionary, without searching.
+
+        Returns {"likely_empty": bool, "terms": [{"field", "term",
+        "doc_freq", "suggestions"}]}. Terms of a field:term clause on another
+        field of the index are looked up in that field (as a whole value if
+        it is a raw field) and carry its name; other terms are looked up in
+        field, the normalized text field by default, with field None.
+        doc_freq sums the document frequencies of the forms the search would
+        try (the Hebrew prefix variants on the normalized field). Absent
+        terms get up to max_suggestions existing terms within max_distance
+        edits that share their first two letters, or that extend them,
+        closest and most frequent first.
+        """
+        searcher = self.get_searcher()
+        default_field = field or self.normalized_field or "text"
+        field_options: Dict[str, Dict[str, Any]] = {}
+        seen = set()
+        checked = []
+        for scope, value in scoped_query_terms(query):
+            if scope in ("text", self.normalized_field):
+                scope = None
+            if scope is not None and scope not in field_options:
+                field_options[scope] = self._field_options(scope)
+            options = field_options.get(scope)
+            if not options:
+                # Unscoped, or a field the index does not have and the search drops
+                scope, term_field = None, default_field
+            else:
+                term_field = scope
+            if scope is not None and (options.get("indexing") or {}).get("tokenizer") == "raw":
+                words = [value]
+            else:
+                words = re.findall(r"\w+", value.lower())
+            for word in words:
+                if (scope, word) in seen:
+                    continue
+                seen.add((scope, word))
+                checked.append({"field": scope, **self._check_term(searcher, term_field, word, max_suggestions,
+                                                                   max_distance, max_candidates)})
+        return {"likely_empty": likely_empty(query, checked), "terms": checked}
+
+    def _check_term(self, searcher, field: str, word: str, max_suggestions: int, max_distance: int,
+                    max_candidates: int) -> Dict[str, Any]:
+        """Return the {"term", "doc_freq", "suggestions"} entry of one word of a field"""
+        normalized = field == self.normalized_field
+        if normalized:
+            word = normalize_hebrew(word)
+            forms = prefix_variants(word) + prefix_stems(word)
+        else:
+            forms = [word]
+        doc_freq = sum(searcher.doc_freq(field, form) for form in forms)
+        suggestions = []
+        if not doc_freq:
+            suggestions = self._suggest_terms(searcher, field, word, max_suggestions, max_distance, max_candidates)
+            if normalized:
+                suggestions = [(restore_final_letter(term), count) for term, count in suggestions]
+        return {
+            "term": restore_final_letter(word) if normalized else word,
+            "doc_freq": doc_freq,
+            "suggestions": [{"term": term, "doc_freq": count} for term, count in suggestions],
+        }
+
+    @staticmethod
+    def _suggest_terms(searcher, field: str, word: str, max_suggestions: int, max_distance: int,
+                       max_candidates: int) -> List[tuple]:
+        """Return the (term, doc_freq) of existing terms close to word, best first"""
+        candidates = {}
+        for term, count in searcher.terms_with_prefix(field, word[:2], limit=max_candidates):
+            distance = edit_distance(word, term, max_distance)
+            if distance <= max_distance or term.startswith(word):
+                candidates[term] = (min(distance, max_distance), -count)
+        ranked = sorted(candidates.items(), key=lambda item: (item[1], item[0]))
+        return [(term, -count) for term, (_, count) in ranked[:max_suggestions]]
+
+    def facets(self, query: str, fields: Sequence[str] = ("topics", "title"),
+               limit: int = 20) -> Dict[str, List[tuple]]:
+        """Count the documents matching a query per value of each field.
+
+        Returns the top limit (value, count) pairs of every field, computed
+        from the index without loading stored documents: a terms aggregation
+        over fast fields, and the term dictionary filtered by the query for
+        other fields indexed with the raw tokenizer. Tokenized fields would
+        count words rather than values, so they get no facet.
+        """
+        try:
+            searcher = self.get_searcher()
+            generation, cacheable = self._cache_generation(searcher)
+            cache_key = ("facets", generation, normalize_query(query), tuple(fields), limit)
+            cached = self.result_cache.get(cache_key) if cacheable else None
+            if cached is not None:
+                return dict(cached)
+            parsed_query = self._parse_query(query, searcher)
+            facets = {field: self._field_facets(searcher, parsed_query, field, limit) for field in fields}
+            if cacheable:
+                self.result_cache.put(cache_key, dict(facets))
+            return facets
+        except Exception as e:
+            self.logger.error(f"Error computing facets for query {query}: {e}")
+            return {}
+
+    def _field_facets(self, searcher, query, field: str, limit: int) -> List[tuple]:
+        """Return the top (value, count) pairs of one field for the documents matching query"""
+        method = self._facet_method(field)
+        if method == "aggregate":
+            aggregation = searcher.aggregate(query, {field: {"terms": {"field": field, "size": limit}}})
+            return [(bucket["key"], bucket["doc_count"]) for bucket in aggregation[field]["buckets"]]
+        if method == "terms":
+            return searcher.terms_with_prefix(field, "", filter_query=query, limit=limit)
+        return []
+
+    def _facet_method(self, field: str) -> str:
+        """Return how facets of a field are counted: "aggregate", "terms" or "none" """
+        method = self._facet_methods.get(field)
+        if method is None:
+            options = self._field_options(field)
+            if options.get("fast"):
+                method = "aggregate"
+            elif (options.get("indexing") or {}).get("tokenizer") == "raw":
+                method = "terms"
+            else:
+                method = "none"
+                self.logger.warning(f"No facets for field {field}: it is not a fast or raw field of the index")
+            self._facet_methods[field] = method
+        return method
+
+    def supports_facets(self, fields: Sequence[str] = ("topics", "title")) -> bool:
+        """Return whether facets() can count values of all the given fields on this index"""
+        return all(self._facet_method(field) != "none" for field in fields)
+
+    def search_many(self, queries: Sequence[str], num_results: int = 10, **kwargs) -> List[List[Dict[str, Any]]]:
+        """Run several queries concurrently over one shared searcher.
+
+        Tantivy releases the GIL while searching, so the queries run in
+        parallel on a thread pool. Results are returned in the order of the
+        queries; keyword arguments are passed on to search().
+        """
+        if not queries:
+            return []
+        searcher = self.get_searcher()
+        if self._executor is None:
+            with self._searcher_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                        thread_name_prefix="tantivy-search")
+        return list(self._executor.map(
+            lambda query: self.search(query, num_results, searcher=searcher, **kwargs),
+            queries,
+        ))
+
+    def _native_highlighter(self, searcher, query, snippet_length: int):
+        """Return a function building a position-based snippet for a document"""
+        generator = SnippetGenerator.create(searcher, query, self.index.schema, "text")
+        generator.set_max_num_chars(snippet_length * HEBREW_BYTES_PER_CHAR)
+
+        def highlight(doc) -> List[str]:
+            fragment = generator.snippet_from_doc(doc).fragment()
+            if len(fragment) > snippet_length:
+                fragment = fragment[:snippet_length + 1].rsplit(" ", 1)[0] or fragment[:snippet_length]
+            if fragment:
+                return [fragment]
+            # The query matched other fields only, fall back to the opening of the text
+            text = doc.get_first("text") or ""
+            return [text[:snippet_length] + "..." if len(text) > snippet_length else text]
+
+        return highlight
+
+    def cache_stats(self) -> Dict[str, Any]:
+        """Return hit/miss/eviction counters of the search result cache"""
+        return self.result_cache.stats()
+
+    def parse_stats(self) -> Dict[str, int]:
+        """Return how often each parse path was taken and the hit counters of the parsed-query cache"""
+        with self._stats_lock:
+            stats = dict(self.parse_paths)
+        query_cache_stats = self.query_cache.stats()
+        stats.update(cache_hits=query_cache_stats["hits"], cache_misses=query_cache_stats["misses"],
+                     cache_entries=query_cache_stats["entries"])
+        return stats
+
     def validate_index(self) -> bool:
         """Validate that the index exists and is accessible"""
         try:
-            # Try to create a searcher and perform a simple search
-            searcher = self.index.searcher()
+            # Try to perform a simple search on the shared searcher
+            searcher = self.get_searcher()
             query_parser = self.index.parse_query("*")
             searcher.search(query_parser, 1)
             return True
         except Exception as e:
             self.logger.error(f"Index validation failed: {e}")
             return False
+
+
+class IndexStatistics:
+    """Document counts summed over several index shards, to score them as one index"""
+
+    def __init__(self, shards: Sequence[TantivySearch]):
+        self.searchers = [shard.get_searcher() for shard in shards]
+        # Part of cache keys, so that scores change when any shard does
+        self.key = tuple(shard.generation for shard in shards)
+        self.num_docs = sum(searcher.num_docs for searcher in self.searchers)
+        self._doc_freqs: Dict[tuple, int] = {}
+
+    def doc_freq(self, field: str, term: str) -> int:
+        key = (field, term)
+        if key not in self._doc_freqs:
+            doc_freq = 0
+            for searcher in self.searchers:
+                try:
+                    doc_freq += searcher.doc_freq(field, term)
+                except ValueError:
+                    # Shards need not share a schema, e.g. only some have the normalized field
+                    pass
+            self._doc_freqs[key] = doc_freq
+        return self._doc_freqs[key]
+
+
+class ShardedTantivySearch:
+    def __init__(self, index_paths: Sequence[str], **kwargs):
+        """Search several index shards (e.g. Tanakh, Talmud, Halacha, PDFs) as one index.
+
+        Each shard is a TantivySearch opened with kwargs, so it can be rebuilt
+        or reloaded on its own. Queries fan out to all shards concurrently and
+        the results are merged by score. Shards score their hits with the
+        document counts of all shards (see TantivySearch.rescore), so that a
+        term common in one corpus but rare overall weighs the same in every
+        shard. metrics and slow_query_seconds are kept by the wrapper rather
+        than the shards, so each search is recorded once, with the fan-out
+        ("shards") and "merge" phases.
+        """
+        self.index_paths = list(index_paths)
+        self.logger = logging.getLogger(__name__)
+        self.metrics = kwargs.pop("metrics", None)
+        self.slow_query_seconds = kwargs.pop("slow_query_seconds", None)
+        if self.metrics is not None:
+            register_search_metrics(self.metrics)
+        self.shards = [TantivySearch(index_path, **kwargs) for index_path in self.index_paths]
+        # Separate from the shards' own pools, which serve their search_many
+        self._executor = ThreadPoolExecutor(max_workers=len(self.shards), thread_name_prefix="tantivy-shard")
+
+    def _trace(self):
+        if self.metrics is not None or self.slow_query_seconds is not None:
+            return SearchTrace()
+        return NULL_TRACE
+
+    def _fan_out(self, call) -> List[Any]:
+        """Run call(shard) on every shard concurrently, returning the results in shard order"""
+        return list(self._executor.map(call, self.shards))
+
+    @staticmethod
+    def _with_score(fields: Optional[Sequence[str]]) -> Optional[List[str]]:
+        """Make sure the shards return scores, which the merge is based on"""
+        if fields is None or "score" in fields:
+            return fields
+        return ["score", *fields]
+
+    @staticmethod
+    def _merge(shard_results: List[List[Dict[str, Any]]], num_results: int,
+               fields: Optional[Sequence[str]]) -> List[Dict[str, Any]]:
+        merged = heapq.nlargest(num_results, (result for results in shard_results for result in results),
+                                key=lambda result: result["score"])
+        if fields is not None and "score" not in fields:
+            for result in merged:
+                del result["score"]
+        return merged
+
+    def search(self, query: str, num_results: int = 10, fields: Optional[Sequence[str]] = None,
+               **kwargs) -> List[Dict[str, Any]]:
+        """Search all shards and return the best num_results results; see TantivySearch.search"""
+        trace = self._trace()
+        shard_fields = self._with_score(fields)
+        statistics = IndexStatistics(self.shards)
+        with trace.span("shards"):
+            shard_results = self._fan_out(lambda shard: shard.search(query, num_results, shard_fields,
+                                                                      statistics=statistics, **kwargs))
+        with trace.span("merge"):
+            results = self._merge(shard_results, num_results, fields)
+        if trace.enabled:
+            record_search(self.metrics, self.slow_query_seconds, query, trace, results,
+                          hits=sum(len(results) for results in shard_results))
+        return results
+
+    def search_many(self, queries: Sequence[str], num_results: int = 10,
+                    fields: Optional[Sequence[str]] = None, **kwargs) -> List[List[Dict[str, Any]]]:
+        """Run several queries on all shards; see TantivySearch.search_many.
+
+        The queries run as one batch, so each is recorded with the timings of the whole batch.
+        """
+        trace = self._trace()
+        shard_fields = self._with_score(fields)
+        statistics = IndexStatistics(self.shards)
+        with trace.span("shards"):
+            per_shard = self._fan_out(lambda shard: shard.search_many(queries, num_results, fields=shard_fields,
+                                                                      statistics=statistics, **kwargs))
+        with trace.span("merge"):
+            all_results = [self._merge([results[i] for results in per_shard], num_results, fields)
+                           for i in range(len(queries))]
+        if trace.enabled:
+            for i, (query, results) in enumerate(zip(queries, all_results)):
+                record_search(self.metrics, self.slow_query_seconds, query, trace, results,
+                              hits=sum(len(shard_results[i]) for shard_results in per_shard))
+        return all_results
+
+    def iter_search(self, query: str, page_size: int = 50, offset: int = 0,
+                    fields: Optional[Sequence[str]] = None, highlights: bool = True,
+                    snippet_mode: str = "regex", snippet_length: int = 200) -> Iterator[Dict[str, Any]]:
+        """Lazily yield the merged results of all shards in score order; see TantivySearch.iter_search.
+
+        The offset applies to the merged results, so each shard is read from
+        its start. Hits are merged by score before any result is built, so the
+        documents of skipped hits are never loaded.
+        """
+        statistics = IndexStatistics(self.shards)
+        streams = []
+        builders = []
+        for position, (shard, searcher) in enumerate(zip(self.shards, statistics.searchers)):
+            shard_fields = shard._check_result_options(fields, snippet_mode)
+            parsed_query = shard._parse_query(query, searcher)
+            builders.append(shard._result_builder(searcher, query, parsed_query, shard_fields, highlights,
+                                                  snippet_mode, snippet_length))
+            streams.append(self._tag_hits(position, shard.iter_hits(searcher, parsed_query, page_size,
+                                                                    statistics=statistics)))
+        merged = heapq.merge(*streams, key=lambda hit: -hit[0])
+        for score, position, doc_address in itertools.islice(merged, offset, None):
+            yield builders[position](score, doc_address, None)
+
+    @staticmethod
+    def _tag_hits(position: int, hits: Iterator[tuple]) -> Iterator[tuple]:
+        """Yield (score, position, doc_address), telling merged hits apart by the position of their shard"""
+        for score, doc_address in hits:
+            yield score, position, doc_address
+
+    def facets(self, query: str, fields: Sequence[str] = ("topics", "title"),
+               limit: int = 20) -> Dict[str, List[tuple]]:
+        """Sum the facet counts of all shards; see TantivySearch.facets"""
+        totals: Dict[str, Dict[Any, int]] = {field: {} for field in fields}
+        # Each shard reports its top values only, so ask for more than limit
+        for shard_facets in self._fan_out(lambda shard: shard.facets(query, fields, limit * 2)):
+            for field, counts in shard_facets.items():
+                for value, count in counts:
+                    totals[field][value] = totals[field].get(value, 0) + count
+        return {
+            field: sorted(counts.items(), key=lambda item: (-item[1], item[0]))[:limit]
+            for field, counts in totals.items()
+        }
+
+    def supports_facets(self, fields: Sequence[str] = ("topics", "title")) -> bool:
+        return all(shard.supports_facets(fields) for shard in self.shards)
+
+    def check_terms(self, query: str, max_suggestions: int = 3, **kwargs) -> Dict[str, Any]:
+        """Check the terms of a query against the term dictionaries of all shards"""
+        checked: Dict[tuple, Dict[str, Any]] = {}
+        for shard_check in self._fan_out(lambda shard: shard.check_terms(query, max_suggestions=max_suggestions,
+                                                                           **kwargs)):
+            for entry in shard_check["terms"]:
+                merged = checked.setdefault((entry["field"], entry["term"]), {
+                    "field": entry["field"], "term": entry["term"], "doc_freq": 0, "suggestions": {},
+                })
+                merged["doc_freq"] += entry["doc_freq"]
+                for suggestion in entry["suggestions"]:
+                    suggestions = merged["suggestions"]
+                    suggestions[suggestion["term"]] = suggestions.get(suggestion["term"], 0) + suggestion["doc_freq"]
+        terms = []
+        for entry in checked.values():
+            # A term found in any shard needs no suggestions
+            suggestions = [] if entry["doc_freq"] else sorted(entry["suggestions"].items(), key=lambda item: -item[1])
+            terms.append({**entry, "suggestions": [{"term": term, "doc_freq": count}
+                                                   for term, count in suggestions[:max_suggestions]]})
+        return {"likely_empty": likely_empty(query, terms), "terms": terms}
+
+    def get_context(self, file_path: str, segment: int, before: int = 2, after: int = 2,
+                    fields: Sequence[str] = ("reference", "line_number", "text")) -> List[Dict[str, Any]]:
+        """Return the segments around a segment from the shard holding the file"""
+        for shard in self.shards:
+            context = shard.get_context(file_path, segment, before, after, fields)
+            if context:
+                return context
+        return []
+
+    def get_document(self, reference: str):
+        """Return the stored document with exactly this reference from the first shard that has it"""
+        for shard in self.shards:
+            doc = shard.get_document(reference)
+            if doc is not None:
+                return doc
+        return None
+
+    def locate(self, reference: str) -> Optional[tuple]:
+        """Return the (file_path, segment) of the document with exactly this reference"""
+        doc = self.get_document(reference)
+        if doc is None:
+            return None
+        return doc.get_first("filePath"), doc.get_first("segment")
+
+    def get_text(self, reference: str) -> Optional[str]:
+        """Return the text stored for exactly this reference, or None"""
+        doc = self.get_document(reference)
+        return doc.get_first("text") if doc is not None else None
+
+    def reload(self):
+        for shard in self.shards:
+            shard.reload()
+
+    def warmup(self, queries: Sequence[str] = DEFAULT_WARMUP_QUERIES):
+        self._fan_out(lambda shard: shard.warmup(queries))
+
+    def is_ready(self) -> bool:
+        return all(shard.is_ready() for shard in self.shards)
+
+    def wait_until_ready(self, timeout: Optional[float] = None) -> bool:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for shard in self.shards:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            if not shard.wait_until_ready(remaining):
+                return False
+        return True
+
+    @property
+    def warmup_seconds(self) -> Optional[float]:
+        durations = [shard.warmup_seconds for shard in self.shards if shard.warmup_seconds is not None]
+        return max(durations) if durations else None
+
+    @property
+    def generation(self) -> tuple:
+        return tuple(shard.generation for shard in self.shards)
+
+    def get_query_instructions(self) -> str:
+        return self.shards[0].get_query_instructions()
+
+    def cache_stats(self) -> Dict[str, Any]:
+        """Return the result cache counters summed over the shards"""
+        stats: Dict[str, Any] = {}
+        for shard_stats in (shard.cache_stats() for shard in self.shards):
+            for key, value in shard_stats.items():
+                if key != "hit_ratio":
+                    stats[key] = stats.get(key, 0) + value
+        lookups = stats.get("hits", 0) + stats.get("misses", 0)
+        stats["hit_ratio"] = stats.get("hits", 0) / lookups if lookups else 0.0
+        return stats
+
+    def parse_stats(self) -> Dict[str, int]:
+        stats: Dict[str, int] = {}
+        for shard_stats in (shard.parse_stats() for shard in self.shards):
+            for key, value in shard_stats.items():
+                stats[key] = stats.get(key, 0) + value
+        return stats
+
+    def validate_index(self) -> bool:
+        return all(shard.validate_index() for shard in self.shards)
+
+
+def open_search(index_paths, **kwargs):
+    """Open one index, or several index shards given a list or an os.pathsep separated string"""
+    if isinstance(index_paths, str):
+        index_paths = [path for path in index_paths.split(os.pathsep) if path]
+    if len(index_paths) == 1:
+        return TantivySearch(index_paths[0], **kwargs)
+    return ShardedTantivySearch(index_paths, **kwargs)
@@ -0,0 +1,329 @@
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+from hebrew import hebrew_numeral
+from references import canonical_reference, format_reference, parse_reference
+import argparse
+import csv
+import json
+import logging
+import mmap
+import os
+import re
+import sqlite3
+import threading
+import time
+
+
+TEXTS_FILE = "texts.bin"
+INDEX_FILE = "refs.sqlite3"
+# Separates the segments in the texts file, so a section is one contiguous slice
+SEGMENT_SEPARATOR = "\x1e"
+# Talmud sections are amudim (2a, 2b, ...) rather than numbered chapters
+TALMUD_SECTION_NAMES = ("Daf", "Folio")
+
+_QUOTES = re.compile("[\"'׳״]")
+_SIMPLE_RANGE = re.compile(r"^(?P<prefix>.*[ :])(?P<first>\d+)-(?P<last>\d+)$")
+
+
+def ref_key(reference: str) -> str:
+    """Return the lookup key of a reference: without quotes, geresh and gershayim, with single spaces"""
+    return " ".join(_QUOTES.sub("", reference).split()).lower()
+
+
+def _he_number(number: int) -> str:
+    """Write a number the way Hebrew references show it, e.g. א׳ or י״ב"""
+    letters = hebrew_numeral(number)
+    return letters + "׳" if len(letters) == 1 else letters[:-1] + "״" + letters[-1]
+
+
+def _address(indices: Tuple[int, ...], talmud: bool, hebrew: bool) -> str:
+    """Return the part of a reference after the title for a section or segment at indices (0-based)"""
+    parts = []
+    for depth, index in enumerate(indices):
+        if depth == 0 and talmud:
+            daf, amud = divmod(index, 2)
+            parts.append(f"{_he_number(daf + 1)} {'אב'[amud]}" if hebrew else f"{daf + 1}{'ab'[amud]}")
+        else:
+            parts.append(_he_number(index + 1) if hebrew else str(index + 1))
+    return ":".join(parts)
+
+
+def iter_export_texts(export_path: str) -> Iterator[Dict[str, Any]]:
+    """Yield the Hebrew merged.json documents of a Sefaria export, in a stable order"""
+    for directory, dirnames, filenames in os.walk(os.path.join(export_path, "json")):
+        dirnames.sort()
+        if os.path.basename(directory) == "Hebrew" and "merged.json" in filenames:
+            with open(os.path.join(directory, "merged.json"), encoding="utf-8") as f:
+                yield json.load(f)
+
+
+def iter_export_links(export_path: str) -> Iterator[Tuple[str, str]]:
+    """Yield (reference, commentary reference) pairs from the link CSV files of a Sefaria export.
+
+    Every commentary link is yielded in both directions, as the Sefaria API
+    lists it on both texts. A range of segments in one section is expanded
+    to its segments; other ranges are linked through their first segment.
+    """
+    for directory, dirnames, filenames in os.walk(os.path.join(export_path, "links")):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if not filename.endswith(".csv"):
+                continue
+            with open(os.path.join(directory, filename), encoding="utf-8", newline="") as f:
+                for row in csv.DictReader(f):
+                    if (row.get("Conection Type") or row.get("Connection Type")) != "commentary":
+                        continue
+                    for first in _expand_range(row["Citation 1"]):
+                        for second in _expand_range(row["Citation 2"]):
+                            yield first, second
+                            yield second, first
+
+
+def _expand_range(reference: str) -> List[str]:
+    match = _SIMPLE_RANGE.match(reference)
+    if not match:
+        return [_range_start(reference)]
+    first, last = int(match.group("first")), int(match.group("last"))
+    return [f"{match.group('prefix')}{number}" for number in range(first, last + 1)]
+
+
+def _range_start(reference: str) -> str:
+    return reference.split("-", 1)[0].strip()
+
+
+class _StoreWriter:
+    """Appends segments to the texts file and their references to the index while building a store"""
+
+    def __init__(self, path: str):
+        self.texts = open(os.path.join(path, TEXTS_FILE), "wb")
+        self.connection = sqlite3.connect(os.path.join(path, INDEX_FILE))
+        self.connection.executescript("""
+            CREATE TABLE entries (id INTEGER PRIMARY KEY, ref TEXT NOT NULL, he_ref TEXT,
+                                  start INTEGER NOT NULL, end INTEGER NOT NULL, section INTEGER NOT NULL);
+            CREATE TABLE keys (key TEXT PRIMARY KEY, id INTEGER NOT NULL) WITHOUT ROWID;
+            CREATE TABLE links (ref TEXT NOT NULL, commentary TEXT NOT NULL);
+        """)
+        self.offset = 0
+        self.num_entries = 0
+        self.num_segments = 0
+        self._entries = []
+        self._keys = []
+
+    def add_text(self, document: Dict[str, Any]):
+        title = document["title"]
+        he_title = document.get("heTitle")
+        talmud = bool(document.get("sectionNames")) and document["sectionNames"][0] in TALMUD_SECTION_NAMES
+        text = document.get("text")
+        if isinstance(text, dict):
+            # A complex text: named nodes get English references only, the default node the plain title
+            for node, node_text in text.items():
+                if node:
+                    self._add_section(f"{title}, {node}", None, node_text, (), talmud)
+                else:
+                    self._add_section(title, he_title, node_text, (), talmud)
+        else:
+            self._add_section(title, he_title, text, (), talmud)
+
+    def _add_section(self, title: str, he_title: Optional[str], text: Any, indices: Tuple[int, ...],
+                     talmud: bool) -> Optional[Tuple[int, int, bool]]:
+        """Write a section or segment and its subsections, returning its (start, end, section) or None if empty"""
+        if isinstance(text, str):
+            if not text:
+                return None
+            data = (text + SEGMENT_SEPARATOR).encode("utf-8")
+            span = (self.offset, self.offset + len(data) - 1, False)
+            self.texts.write(data)
+            self.offset += len(data)
+            self.num_segments += 1
+        elif isinstance(text, list):
+            spans = [self._add_section(title, he_title, child, indices + (i,), talmud)
+                     for i, child in enumerate(text)]
+            spans = [span for span in spans if span is not None]
+            if not spans:
+                return None
+            span = (spans[0][0], spans[-1][1], True)
+        else:
+            return None
+        if indices:
+            reference = f"{title} {_address(indices, talmud, hebrew=False)}"
+            he_reference = f"{he_title} {_address(indices, talmud, hebrew=True)}" if he_title else None
+            self._add_entry(reference, he_reference, span)
+        return span
+
+    def _add_entry(self, reference: str, he_reference: Optional[str], span: Tuple[int, int, bool]):
+        self.num_entries += 1
+        self._entries.append((self.num_entries, reference, he_reference, *span))
+        self._keys.append((ref_key(reference), self.num_entries))
+        if he_reference:
+            self._keys.append((ref_key(he_reference), self.num_entries))
+        if len(self._entries) == 100_000:
+            self._flush()
+
+    def _flush(self):
+        with self.connection:
+            self.connection.executemany("INSERT INTO entries VALUES (?, ?, ?, ?, ?, ?)", self._entries)
+            # The first text claiming a reference keeps it
+            self.connection.executemany("INSERT OR IGNORE INTO keys VALUES (?, ?)", self._keys)
+        self._entries = []
+        self._keys = []
+
+    def add_links(self, links: Iterator[Tuple[str, str]]) -> int:
+        count = 0
+        batch = []
+        for link in links:
+            batch.append(link)
+            if len(batch) == 100_000:
+                count += self._insert_links(batch)
+                batch = []
+        return count + self._insert_links(batch)
+
+    def _insert_links(self, batch: List[Tuple[str, str]]) -> int:
+        with self.connection:
+            self.connection.executemany("INSERT INTO links VALUES (?, ?)",
+                                        ((ref_key(ref), commentary) for ref, commentary in batch))
+        return len(batch)
+
+    def close(self):
+        self._flush()
+        self.texts.close()
+        with self.connection:
+            self.connection.execute("CREATE INDEX links_ref ON links (ref)")
+        self.connection.execute("VACUUM")
+        self.connection.close()
+
+
+def build_text_store(export_path: str, store_path: str) -> Dict[str, Any]:
+    """Build a text store at store_path from the texts and links of a Sefaria export.
+
+    The store is written next to store_path and swapped in when complete,
+    so an existing store keeps serving lookups meanwhile.
+    """
+    start = time.monotonic()
+    staging_path = os.path.normpath(store_path) + ".building"
+    os.makedirs(staging_path, exist_ok=True)
+    for name in (TEXTS_FILE, INDEX_FILE):
+        if os.path.exists(os.path.join(staging_path, name)):
+            os.remove(os.path.join(staging_path, name))
+
+    writer = _StoreWriter(staging_path)
+    num_texts = 0
+    for document in iter_export_texts(export_path):
+        writer.add_text(document)
+        num_texts += 1
+    num_links = writer.add_links(iter_export_links(export_path))
+    stats = {"texts": num_texts, "segments": writer.num_segments, "refs": writer.num_entries,
+             "links": num_links, "bytes": writer.offset}
+    writer.close()
+
+    old_path = os.path.normpath(store_path) + ".old"
+    if os.path.exists(store_path):
+        os.replace(store_path, old_path)
+    os.replace(staging_path, store_path)
+    if os.path.exists(old_path):
+        for name in os.listdir(old_path):
+            os.remove(os.path.join(old_path, name))
+        os.rmdir(old_path)
+    stats["seconds"] = time.monotonic() - start
+    return stats
+
+
+class TextStore:
+    """Read-only access to a text store built from a Sefaria export.
+
+    Segment texts are read straight from the memory-mapped texts file at
+    the offsets recorded in a SQLite index of references (English and
+    Hebrew), which also holds the commentary links.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.logger = logging.getLogger(__name__)
+        index_path = os.path.join(path, INDEX_FILE)
+        if not os.path.exists(index_path):
+            raise FileNotFoundError(f"No text store at {path}")
+        self._index_uri = f"file:{os.path.abspath(index_path)}?mode=ro"
+        self._local = threading.local()
+        with open(os.path.join(path, TEXTS_FILE), "rb") as f:
+            # mmap cannot map an empty file
+            self._texts = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else b""
+
+    def _connection(self) -> sqlite3.Connection:
+        # SQLite connections are not shared between threads
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self._index_uri, uri=True)
+            connection.execute("PRAGMA mmap_size = 268435456")
+            self._local.connection = connection
+        return connection
+
+    def _entry(self, reference: str) -> Optional[tuple]:
+        for key in dict.fromkeys((ref_key(reference), ref_key(canonical_reference(reference)))):
+            entry = self._connection().execute(
+                "SELECT ref, he_ref, start, end, section FROM entries JOIN keys USING (id) WHERE key = ?", (key,)
+            ).fetchone()
+            if entry is not None:
+                return entry
+        return None
+
+    def __contains__(self, reference: str) -> bool:
+        return self._entry(reference) is not None
+
+    def get_text(self, reference: str) -> Union[str, List[str], None]:
+        """Return the text of a segment, the segment texts of a section or range, or None if unknown.
+
+        Ranges are supported within one section, e.g. Genesis 1:1-3.
+        """
+        entry = self._entry(reference)
+        if entry is None:
+            return self._get_range(reference)
+        _, _, start, end, section = entry
+        text = self._texts[start:end].decode("utf-8")
+        return text.split(SEGMENT_SEPARATOR) if section else text
+
+    def _get_range(self, reference: str) -> Optional[List[str]]:
+        parsed = parse_reference(reference)
+        if parsed is None or parsed.end is None or parsed.start[:-1] != parsed.end[:-1] \
+                or not (parsed.start[-1].isdigit() and parsed.end[-1].isdigit()):
+            return None
+        texts = []
+        for number in range(int(parsed.start[-1]), int(parsed.end[-1]) + 1):
+            text = self.get_text(format_reference(parsed._replace(start=parsed.start[:-1] + (str(number),), end=None)))
+            if isinstance(text, str):
+                texts.append(text)
+        return texts or None
+
+    def get_he_ref(self, reference: str) -> Optional[str]:
+        """Return the Hebrew form of a reference, or None if the store does not know it"""
+        entry = self._entry(reference)
+        return entry[1] or entry[0] if entry is not None else None
+
+    def get_commentaries(self, reference: str) -> List[str]:
+        """Return the references of the commentaries linked to a reference, in Hebrew when known"""
+        # Links are recorded under the English reference
+        entry = self._entry(reference)
+        key = ref_key(entry[0] if entry is not None else reference)
+        rows = self._connection().execute(
+            "SELECT commentary FROM links WHERE ref = ? ORDER BY rowid", (key,)
+        ).fetchall()
+        commentaries = []
+        for (commentary,) in rows:
+            he_ref = self.get_he_ref(commentary)
+            commentaries.append(he_ref or commentary)
+        return list(dict.fromkeys(commentaries))
+
+    def close(self):
+        if isinstance(self._texts, mmap.mmap):
+            self._texts.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the offline text store from a Sefaria export")
+    parser.add_argument("export", help="directory of the export, holding json/ and links/")
+    parser.add_argument("--store", default=os.getenv("TEXT_STORE_PATH", "./text_store"), help="store directory")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    print(json.dumps(build_text_store(args.export, args.store), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,32 @@
 from langchain_core.tools import tool
-from sefaria import get_text as sefaria_get_text, get_commentaries as sefaria_get_commentaries
-from tantivy_search import TantivySearch
-from typing import Optional
+from sefaria import get_text as sefaria_get_text, get_commentaries as sefaria_get_commentaries, AsyncSefariaClient
+from tantivy_search import open_search
+from result_formatter import format_results
+from metrics import MetricsRegistry
+from typing import List, Optional
+import asyncio
+import os
 from pydantic import BaseModel, Field
 
 from app import INDEX_PATH
 
+# Upper bound on the tokens a single search tool call adds to the conversation
+SEARCH_TOKEN_BUDGET = 3000
+# Same for a verse read together with its commentaries
+COMMENTARIES_TOKEN_BUDGET = 4000
+
 class ReadTextArgs(BaseModel):
         reference: str = Field(description="The reference to retrieve the text for. examples: בראשית א פרק א, Genesis 1:1")
 
+class ReadContextArgs(BaseModel):
+        reference: str = Field(description="The exact reference of a search result, as returned by the search tool")
+        before: int = Field(description="the number of preceding passages to include. Default: 2", default=2)
+        after: int = Field(description="the number of following passages to include. Default: 2", default=2)
+
+class ReadCommentariesArgs(BaseModel):
+        reference: str = Field(description="The reference of the verse, e.g. בראשית א:א")
+        max_commentaries: int = Field(description="the maximum number of commentaries to read. Default: 10", default=10)
+
 class SearchArgs(BaseModel):
         query: str = Field(description="""the query for the search.
     Instructions for generating a query:
@@ -72,41 +90,111 @@ class SearchArgs(BaseModel):
     """)
         num_results: int = Field(description="the maximum number of results to return. Default: 10", default=10)
 
+class FacetsArgs(BaseModel):
+        query: str = Field(description="the query to count matches for, using the same syntax as the search tool")
+        fields: List[str] = Field(description="the fields to count the matches by: topics, title. Default: both", default=["topics", "title"])
 
+class MultiSearchArgs(BaseModel):
+        queries: List[str] = Field(description="""several alternative queries to run at once, using the same syntax as the search tool.
+    use it to try different phrasings of the same idea in one call, e.g. in Biblical Hebrew, Mishnaic Hebrew and Talmudic Aramaic.""")
+        num_results: int = Field(description="the maximum number of results to return for each query. Default: 10", default=10)
 
-index_path = INDEX_PATH
+
+
+# Several index shards can be searched together, separated like PATH entries
+index_path = os.getenv("INDEX_PATHS", INDEX_PATH)
+# Search instrumentation is off unless asked for
+search_metrics = MetricsRegistry() if os.getenv("SEARCH_METRICS") else None
+slow_query_ms = os.getenv("SLOW_QUERY_MS")
 try:
-    tantivy = TantivySearch(index_path)
+    tantivy = open_search(index_path, build_reference_map=True, warmup=True, metrics=search_metrics,
+                          slow_query_seconds=float(slow_query_ms) / 1000 if slow_query_ms else None)
     tantivy.validate_index()    
 except Exception as e:
     raise Exception(f"failed to create index: {e}")
+# Indexes with tokenized topics and titles cannot count matches per value
+facets_supported = tantivy.supports_facets()
         
             
     
+def no_results_hint(query: str) -> List[dict]:
+    """Explain an empty search by the query terms missing from the library, with close existing terms"""
+    notes = []
+    for entry in tantivy.check_terms(query)["terms"]:
+        if not entry["doc_freq"]:
+            term = f"{entry['field']}:{entry['term']}" if entry["field"] else entry["term"]
+            note = f"'{term}' does not appear in the library"
+            if entry["suggestions"]:
+                note += f", did you mean: {', '.join(suggestion['term'] for suggestion in entry['suggestions'])}"
+            notes.append(note)
+    return [{'reference': 'no results', 'text': '; '.join(notes) or 'no passage matches all the query terms'}]
+
+
 @tool(args_schema=SearchArgs)
 def search( query: str, num_results: int = 10):
     """Searches the index for the given query."""
-    results = tantivy.search(query, num_results)
-    formatted_results = []
-    for result in results:
-        formatted_results.append({
-            'text': result.get('text', 'N/A'),
-            'reference': result.get('reference', 'N/A')
-        })
-            
-    return formatted_results
+    results = tantivy.search(query, num_results, fields=["text", "reference"], snippet_mode="native",
+                             collapse="file_path", collapse_size=3)
+    return format_results(results, SEARCH_TOKEN_BUDGET) or no_results_hint(query)
+
+
+@tool(args_schema=MultiSearchArgs)
+def multi_search(queries: List[str], num_results: int = 10):
+    """Searches the index for several queries at once and returns the results of each query."""
+    all_results = tantivy.search_many(queries, num_results, fields=["text", "reference"], snippet_mode="native",
+                                      collapse="file_path", collapse_size=3)
+    budget = SEARCH_TOKEN_BUDGET // max(len(queries), 1)
+    return [
+        {'query': query, 'results': format_results(results, budget) or no_results_hint(query)}
+        for query, results in zip(queries, all_results)
+    ]
 
 
 @tool(args_schema=ReadTextArgs)
 def read_text(reference: str )->str:
     """Retrieves the text for a given reference.  
     """
-    text = sefaria_get_text(reference)
+    text = tantivy.get_text(reference)
+    if search_metrics is not None:
+        # How many reads the local index serves without Sefaria
+        search_metrics.inc("read_text_total", source="local" if text is not None else "sefaria")
+    if text is None:
+        text = sefaria_get_text(reference)
     return {
         'text': str(text),
         'reference': reference
     }
 
+@tool(args_schema=FacetsArgs)
+def count_matches(query: str, fields: List[str] = ["topics", "title"]):
+    """Counts the matches of a query per topic and per book title, to choose a filter (e.g. topics:הלכה) before searching."""
+    if not facets_supported:
+        return {'text': 'facets unsupported on this index'}
+    facets = tantivy.facets(query, fields)
+    return {field: dict(counts) for field, counts in facets.items()}
+
+
+@tool(args_schema=ReadContextArgs)
+def read_context(reference: str, before: int = 2, after: int = 2):
+    """Retrieves the passages surrounding a search result from the local library, in order."""
+    location = tantivy.locate(reference)
+    if location is None:
+        return [{'text': 'N/A', 'reference': reference}]
+    file_path, segment = location
+    return tantivy.get_context(file_path, segment, before, after, fields=("reference", "text"))
+
+sefaria_client = AsyncSefariaClient()
+
+
+@tool(args_schema=ReadCommentariesArgs)
+def read_commentaries(reference: str, max_commentaries: int = 10):
+    """Retrieves the text of a verse together with the texts of its commentaries, all in one call."""
+    data = asyncio.run(sefaria_client.get_with_commentaries(reference, max_commentaries))
+    passages = [{'reference': reference, 'text': str(data['text'])}] + [
+        {'reference': commentary, 'text': str(text)} for commentary, text in data['commentaries'].items()
+    ]
+    return format_results(passages, COMMENTARIES_TOKEN_BUDGET)
+
 @tool
 def get_commentaries(reference: str, num_results: int = 10)->str:
     """Retrieves references to all available commentaries on the given verse."""